@@ -0,0 +1,191 @@
+'''
+Copyright 2017 Marianne Linhares Monteiro, @mari-linhares at github.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import argparse
+import logging
+import time
+
+# for vectors manipulation
+import numpy as np
+
+from checkpoint import atomic_write
+import physics
+from seeding import make_rng, spawn_seeds
+from training_log import TrainingLog, configure_logging
+from vector_env import VectorEnvironment
+
+LEVEL_OUTPUT = 'actor_critic_training.csv'
+PARAMETERS_OUTPUT = 'actor_critic.npz'
+
+# launch angles are kept inside the range of the discrete actions
+MAX_ANGLE = float(np.abs(physics.ACTIONS).max())
+
+logger = logging.getLogger(__name__)
+
+
+class ActorCriticAgent():
+    '''Actor-critic agent with a continuous launch angle.
+
+       The actor is a Gaussian policy: the mean angle is
+       MAX_ANGLE * tanh(w_mu . phi(s)) and the standard deviation
+       exp(log_std) is learned too. The critic is linear, v(s) = w_v . phi(s).
+       phi(s) is the board with a bias feature.
+
+       Both are trained with one step TD errors computed for a whole batch
+       of games at once (see VectorEnvironment.step_angles), so choosing an
+       angle is a single product and there is no argmax over actions.
+    '''
+    def __init__(self, num_features=physics.NUM_ROWS * physics.NUM_COLS,
+                 discount_factor=0.99, actor_step=0.01, critic_step=0.05,
+                 std=0.5, min_std=0.02, seed=None):
+        self.disc_factor = discount_factor
+        self.actor_step = actor_step
+        self.critic_step = critic_step
+        self.min_log_std = np.log(min_std)
+
+        self.rng = make_rng(seed)
+        self.w_mu = np.zeros(num_features + 1)
+        self.log_std = np.log(std)
+        self.w_v = np.zeros(num_features + 1)
+
+        # number of updates done so far
+        self.updates = 0
+
+    def features(self, states):
+        '''(batch, rows, cols) boards to (batch, cells + 1) features.'''
+        states = np.reshape(states, (len(states), -1))
+        return np.hstack([states, np.ones((len(states), 1))])
+
+    def mean_angles(self, phi):
+        return MAX_ANGLE * np.tanh(phi.dot(self.w_mu))
+
+    def get_values(self, phi):
+        return phi.dot(self.w_v)
+
+    def policy(self, states):
+        '''Samples an angle for each state.
+
+            Returns:
+                angles (tensor): angles to shoot, clipped to MAX_ANGLE.
+                samples (tensor): angles before clipping (used by update).
+        '''
+        mu = self.mean_angles(self.features(states))
+        noise = self.rng.standard_normal(mu.size)
+        samples = mu + np.exp(self.log_std) * noise
+        return np.clip(samples, -MAX_ANGLE, MAX_ANGLE), samples
+
+    def choose_best_angle(self, s):
+        '''Mean angle of the policy, for playing without exploration.'''
+        return self.mean_angles(self.features(s[np.newaxis]))[0]
+
+    def update(self, states, samples, rewards, next_states, terminals):
+        '''One actor and critic update from a batch of transitions.
+
+            Returns:
+                deltas (tensor): (batch,) TD errors.
+        '''
+        phi = self.features(states)
+        next_v = np.where(terminals, 0,
+                          self.get_values(self.features(next_states)))
+        deltas = rewards + self.disc_factor * next_v - self.get_values(phi)
+
+        # critic: semi-gradient TD(0)
+        self.w_v += self.critic_step * deltas.dot(phi) / len(deltas)
+
+        # actor: delta * grad log pi(sample | s), averaged over the batch
+        pre = phi.dot(self.w_mu)
+        mu = MAX_ANGLE * np.tanh(pre)
+        var = np.exp(2 * self.log_std)
+        noise = samples - mu
+        grad_mu = deltas * noise / var * MAX_ANGLE * (1 - np.tanh(pre) ** 2)
+        grad_log_std = deltas * (noise ** 2 / var - 1)
+        self.w_mu += self.actor_step * grad_mu.dot(phi) / len(deltas)
+        self.log_std = max(self.min_log_std, self.log_std +
+                           self.actor_step * grad_log_std.mean())
+
+        self.updates += 1
+        return deltas
+
+    # ----------------- Saving ---------------------
+    def save(self, path=PARAMETERS_OUTPUT):
+        atomic_write(path, lambda f: np.savez(
+            f, w_mu=self.w_mu, log_std=self.log_std, w_v=self.w_v,
+            updates=self.updates))
+
+    def load(self, path=PARAMETERS_OUTPUT):
+        with np.load(path) as parameters:
+            self.w_mu = parameters['w_mu']
+            self.log_std = float(parameters['log_std'])
+            self.w_v = parameters['w_v']
+            self.updates = int(parameters['updates'])
+
+    def train(self, vector_env, updates=None, save_every=100):
+        '''Trains on the games of vector_env for a number of updates
+           (forever if None), logging every finished game.
+        '''
+        start = time.time()
+        episode = 0
+        states = vector_env.reset()
+        lengths = np.zeros(vector_env.num_envs, dtype=int)
+        with TrainingLog(LEVEL_OUTPUT) as training_log:
+            while updates is None or self.updates < updates:
+                angles, samples = self.policy(states)
+                next_states, rewards, dones = vector_env.step_angles(angles)
+                self.update(states, samples, rewards, next_states, dones)
+                lengths += 1
+
+                for length in lengths[dones]:
+                    training_log.log(episode, length, -1,
+                                     np.exp(self.log_std), time.time() - start)
+                    episode += 1
+                lengths[dones] = 0
+                states = next_states
+
+                if self.updates % save_every == 0:
+                    self.save()
+                    logger.info('Update: %d, episodes: %d, max phase: %d, '
+                                'std: %.3f', self.updates, episode,
+                                vector_env.max_phase, np.exp(self.log_std))
+        self.save()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Train the actor-critic agent (continuous angles).')
+    parser.add_argument('--envs', type=int, default=256,
+                        help='games played at the same time')
+    parser.add_argument('--updates', type=int, default=None,
+                        help='number of updates (default: train forever)')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue from %s' % PARAMETERS_OUTPUT)
+    parser.add_argument('--seed', type=int, default=None,
+                        help='makes the whole run reproducible')
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help='-v shows progress')
+    args = parser.parse_args()
+    configure_logging(args.verbose)
+
+    seeds = [None] * 2
+    if args.seed is not None:
+        seeds = spawn_seeds(args.seed, 2)
+
+    agent = ActorCriticAgent(seed=seeds[0])
+    if args.resume:
+        agent.load()
+    agent.train(VectorEnvironment(args.envs, seed=seeds[1]), args.updates)
+
+if __name__ == "__main__":
+    main()
@@ -14,23 +14,41 @@ See the License for the specific language governing permissions and
 limitations under the License.
 '''
 
+import argparse
+import logging
+import time
+
 # for vectors manipulation
 import numpy as np
 
-import random
-
-# for copying python objects
-import copy
-
 from game import *
+from checkpoint import CheckpointManager, load_snapshot
+from curriculum import Curriculum, TrainingBudget
+import inference
+from instrument import Instrumentation
+import physics
+from renderer import Renderer, toggle_on_signal
+from replay import ReplayBuffer
+from seeding import make_rng, spawn_seeds
+from shot_cache import ShotCache
+from traces import DenseEligibilityTrace, EligibilityTrace
+from vector_env import VectorEnvironment
+from training_log import TrainingLog, configure_logging
+from trajectory import TrajectoryWriter
 
 LEVEL_OUTPUT = 'agent_training.csv'
-THETA_OUTPUT = 'pretrained_agent.npy'
+THETA_OUTPUT = inference.THETA_OUTPUT
+PROFILE_OUTPUT = 'agent_profile.csv'
+PSTATS_OUTPUT = 'agent_profile.pstats'
+
+logger = logging.getLogger(__name__)
 
 
 class LinearFunctionSarsaAgent():
     
-    def __init__(self, environment, discount_factor=0.2, _lambda=1):
+    def __init__(self, environment, discount_factor=0.2, _lambda=1,
+                 theta=None, trace_cutoff=None, mmap=False, replay=None,
+                 replay_batch_size=32, seed=None):
 
         # pygame environemnt
         self.env = environment
@@ -39,18 +57,46 @@ class LinearFunctionSarsaAgent():
         self._lambda = _lambda
         self.number_of_parameters = self.env.bricks_matrix.shape[0] * self.env.bricks_matrix.shape[1] * self.env.number_of_actions
         self.disc_factor = discount_factor
+
+        # every random decision of the agent comes from self.rng
+        self.rng = make_rng(seed)
         
         # parameters are initialized randomly
-        try:
-            self.theta = np.load(THETA_OUTPUT)
-            print 'loading %s' % THETA_OUTPUT
-        except IOError:
-            print 'initializing theta randomly'
-            self.theta = np.random.randn(self.number_of_parameters) * 0.1
+        if theta is not None:
+            self.theta = theta
+        else:
+            self.theta = self.load_theta(mmap)
         
-        # eligibility trace
-        self.E = self.get_clear_tensor()
+        # eligibility trace, a dense vector unless trace_cutoff is given
+        # (then only entries >= trace_cutoff are kept)
+        if trace_cutoff is None:
+            self.E = DenseEligibilityTrace(self.number_of_parameters)
+        else:
+            self.E = EligibilityTrace(trace_cutoff)
+
+        # optional ReplayBuffer, every step also learns from a minibatch
+        self.replay = replay
+        self.replay_batch_size = replay_batch_size
+
+        # number of episodes trained so far
+        self.episode = 0
+        # actions and lengths of the batched games restored by restore
+        self.batch = None
     
+    def load_theta(self, mmap=False):
+        '''Loads THETA_OUTPUT if it exists, otherwise returns random values.
+
+           With mmap theta is a read-only memory map of the file, which is
+           only useful when the agent will not be trained.
+        '''
+        try:
+            theta = inference.load_theta(THETA_OUTPUT, mmap)
+            logger.info('loading %s', THETA_OUTPUT)
+        except IOError:
+            logger.info('initializing theta randomly')
+            theta = self.rng.randn(self.number_of_parameters) * 0.1
+        return theta
+
     def get_clear_tensor(self):
         '''
             Returns a tensor with zeros with the correct shape.
@@ -58,13 +104,32 @@ class LinearFunctionSarsaAgent():
         return np.zeros(self.number_of_parameters)
 
     def get_q(self, s, a):
-        return np.dot(self.phi(s, a), self.theta)
+        idx, values = self.active_features(s, a)
+        return np.dot(values, self.theta[idx])
 
     def phi(self, s, a):        
         features = np.zeros((self.env.bricks_matrix.shape[0], self.env.bricks_matrix.shape[1], self.env.number_of_actions), dtype=np.int)
         features[:, :, a] = s
 
         return features.flatten()
+
+    def active_features(self, s, a):
+        '''Indexes and values of the non zero entries of phi(s, a).
+
+           phi(s, a) is s placed at the slice of action a, so only the bricks
+           of s are active and theta never needs to be touched elsewhere.
+           s can also be a compact board (see board.py).
+        '''
+        if hasattr(s, 'features'):
+            cells, values = s.features()
+        else:
+            cells = np.flatnonzero(s)
+            values = s.ravel()[cells]
+        return cells * self.env.number_of_actions + a, values
+
+    def get_theta_matrix(self):
+        '''theta as a (bricks, actions) matrix (a view, not a copy).'''
+        return self.theta.reshape(-1, self.env.number_of_actions)
    
     def get_alpha(self, s, a):
         return 0.01
@@ -76,90 +141,510 @@ class LinearFunctionSarsaAgent():
         #print 'state:'
         #print s
         #print 'all actions at this state:'
-        #print [np.dot(self.phi(s, a), self.theta) for a in range(self.env.number_of_actions)]
-        return [np.dot(self.phi(s, a), self.theta) for a in range(self.env.number_of_actions)]
+        #print self.get_theta_matrix().T.dot(s.ravel())
+        # q(s, a) for every action in a single product
+        if hasattr(s, 'features'):
+            cells, values = s.features()
+            return values.dot(self.get_theta_matrix()[cells])
+        return np.ravel(s).dot(self.get_theta_matrix())
     
     def get_max_action(self, s):
         return np.max(self.try_all_actions(s))
     
     def choose_random_action(self):
-        return np.random.choice(range(self.env.number_of_actions))
+        return self.rng.randint(self.env.number_of_actions)
  
     def choose_best_action(self, s):
         return np.argmax(self.try_all_actions(s))
     
     def policy(self, s): 
-        if random.random() <= self.get_e(s):
-            print 'random'
+        if self.rng.random_sample() <= self.get_e(s):
+            logger.debug('random')
             action = self.choose_random_action()
         else:
-            print 'best'
+            logger.debug('best')
             action = self.choose_best_action(s)
 
         return action
 
-    def train(self):
-        e = 0
-        f = open(LEVEL_OUTPUT, 'a+')
+    def seed(self, seed):
+        '''Reseeds the agent and its environment with independent streams
+           derived from seed.
+        '''
+        agent_seed, env_seed = spawn_seeds(seed, 2)
+        self.rng.seed(agent_seed)
+        self.env.seed(env_seed)
+
+    def update_theta(self, step):
+        '''Applies the update step * E to theta (step is alpha * delta).'''
+        self.E.apply(self.theta, step)
+
+    def run_episode(self, max_steps=None, depth=1):
+        '''Plays one game learning from it.
+
+           The game starts with depth rows of bricks (see Environment.prefill)
+           and is stopped after max_steps shots if it is not over yet. The
+           last update of a stopped game still bootstraps from q(s', a'),
+           since s' is not a terminal state, and the game is restarted.
+
+           Returns:
+               phase (int): number of phases played.
+               reward (int): sum of the rewards of the episode (0 if the
+                   game was stopped by max_steps, -1 if it was lost).
+        '''
+        # clear eligibility trace
+        self.E.clear()
+        # get initial state for current episode
+        self.env.prefill(depth)
+        s = self.env.get_board()
+        # choose a from s with epsilon greedy policy
+        a = self.policy(s)
+        next_a = a 
+             
+        # while game has not ended
+        is_s_terminal = False
         phase = 0
-        while 1:
-            # clear eligibility trace
-            self.E = self.get_clear_tensor()
-            # get initial state for current episode
-            self.env.next_phase()   
-            s = copy.copy(self.env.bricks_matrix)
-            # choose a from s with epsilon greedy policy
-            a = self.policy(s)
-            next_a = a 
-                 
-            # while game has not ended
-            is_s_terminal = False
-            phase = 0
-            while not is_s_terminal:
-                phase += 1
-                # execute action
-                print 'action: ', a, self.env.actions[a]
-                print 'state:'
-                print s
-                next_s, r = self.env.step(copy.copy(s), a)
-              
-                # get parameters that represent this state and action
-                phi = self.phi(s, a)
-                # get q(s, a)
-                q = self.get_q(s, a)
-                
-                if r != -1:
-                    # choose next action with epsilon greedy policy
-                    next_a = self.policy(next_s)
-                    q_next = self.get_q(next_s, next_a)
-                    delta = r + q_next - q
-                else:
-                    delta = r - q 
-
-                self.E += phi
-                alpha = self.get_alpha(s, a)
-                update_q = alpha * delta * self.E
-                self.theta += update_q
-                self.E *= (self.disc_factor * self._lambda)
-                
-                # update state and action
-                s = next_s
-                a = next_a
-                is_s_terminal = (r == -1)
+        reward = 0
+        while not is_s_terminal:
+            phase += 1
+            # execute action
+            logger.debug('action: %d %f\nstate:\n%s', a, self.env.actions[a],
+                         s)
+            next_s, r = self.env.step(s, a)
+            reward += r
+          
+            # get parameters that represent this state and action
+            idx, values = self.active_features(s, a)
+            # get q(s, a)
+            q = np.dot(values, self.theta[idx])
             
-            if e % 10 == 0:
-                np.save(THETA_OUTPUT, self.theta)                
-                print "Episode: %d" % e
+            if r != -1:
+                # choose next action with epsilon greedy policy
+                next_a = self.policy(next_s)
+                q_next = self.get_q(next_s, next_a)
+                delta = r + q_next - q
+            else:
+                delta = r - q 
+
+            self.E.add(idx, values)
+            alpha = self.get_alpha(s, a)
+            self.update_theta(alpha * delta)
+            self.E.decay(self.disc_factor * self._lambda)
+
+            if self.replay is not None:
+                self.replay.add(s, a, r, next_s, next_a, r == -1)
+                if len(self.replay) >= self.replay_batch_size:
+                    self.replay_update(self.replay_batch_size)
+            
+            # update state and action
+            s = next_s
+            a = next_a
+            is_s_terminal = (r == -1)
+
+            if not is_s_terminal and phase == max_steps:
+                # truncated, the game is not over but a new one starts
+                self.env.init_game(self.env.ball_speed)
+                break
+
+        return phase, reward
+
+    def replay_update(self, batch_size):
+        '''One Sarsa update from a minibatch sampled from self.replay.
+
+           q(s, a) of the whole batch is computed with a single product and
+           the updates are accumulated in theta with np.add.at, so repeated
+           actions in the batch add up. Returns the TD errors.
+        '''
+        indexes, batch, weights = self.replay.sample(batch_size)
+        states, actions, rewards, next_states, next_actions, terminals = batch
+
+        deltas = self.batch_update(states, actions, rewards, next_states,
+                                   next_actions, terminals, weights)
+        self.replay.update_priorities(indexes, deltas)
+        return deltas
+
+    def batch_update(self, states, actions, rewards, next_states,
+                     next_actions, terminals, weights=None):
+        '''One step Sarsa update from a batch of transitions.
+
+           q(s, a) and q(s', a') of the whole batch are computed with a
+           single product each and all the updates are accumulated in theta
+           with np.add.at, so transitions with the same action add up.
 
-            f.write('%d, %d\n' % (e, phase))
-            e += 1
+            Args:
+                states, next_states (tensor): (batch, rows, cols) or
+                    (batch, rows * cols) bricks values.
+                actions, next_actions (tensor): (batch,) action indexes.
+                rewards (tensor): (batch,) rewards.
+                terminals (tensor): (batch,) True if the game ended, q(s', a')
+                    is not used for these.
+                weights (tensor): (batch,) optional weights of the updates.
+            Returns:
+                deltas (tensor): (batch,) TD errors before the update.
+        '''
+        batch_size = len(actions)
+        states = np.reshape(states, (batch_size, -1))
+        next_states = np.reshape(next_states, (batch_size, -1))
+
+        # (actions, bricks) view of theta, rows are the action slices
+        theta = self.get_theta_matrix().T
+        q = np.einsum('ij,ij->i', states, theta[actions])
+        q_next = np.einsum('ij,ij->i', next_states, theta[next_actions])
+        deltas = rewards + np.where(terminals, 0, q_next) - q
+
+        step = self.get_alpha(None, None) * deltas
+        if weights is not None:
+            step = step * weights
+        np.add.at(theta, actions, states * step[:, np.newaxis])
+        return deltas
+
+    def policy_batch(self, states):
+        '''Epsilon greedy actions for a (batch, rows, cols) tensor of states.'''
+        batch_size = states.shape[0]
+        q = np.reshape(states, (batch_size, -1)).dot(self.get_theta_matrix())
+        actions = np.argmax(q, axis=1)
+        explore = self.rng.random_sample(batch_size) <= self.get_e(None)
+        actions[explore] = self.rng.randint(self.env.number_of_actions,
+                                             size=np.count_nonzero(explore))
+        return actions
+
+    # ----------------- Checkpoints ---------------------
+    def save_checkpoint(self, checkpoints, vector_env=None, actions=None,
+                        lengths=None, curriculum=None):
+        '''Schedules a snapshot of everything needed to resume training.
+
+           When training on a VectorEnvironment its state is saved too, with
+           the actions chosen for the next step and the lengths of the games
+           being played (see train_batched). So are the rng of curriculum
+           and the replay buffer.
+        '''
+        extra = {'agent_rng': self.rng.get_state(),
+                 'env_rng': self.env.rng.get_state(),
+                 'max_phase': self.env.max_phase,
+                 'env_episode': self.env.episode,
+                 'rows': self.env.row_generator.get_state()}
+        if vector_env is not None:
+            extra['vector_env'] = vector_env.get_state()
+            extra['batch'] = {'actions': actions.copy(),
+                              'lengths': lengths.copy()}
+        if curriculum is not None:
+            extra['curriculum_rng'] = curriculum.rng.get_state()
+        if self.replay is not None:
+            extra['replay'] = self.replay.get_state()
+        checkpoints.save(self.episode, self.theta, self.E.items(), extra)
+
+    def restore(self, path, vector_env=None, curriculum=None):
+        '''Resumes training from a snapshot saved by save_checkpoint.
+
+           The games of vector_env are restored too if the snapshot was
+           saved by train_batched (with the same number of games), the next
+           call to train_batched continues them. Likewise the rng of
+           curriculum and the replay buffer if the snapshot was saved with
+           them.
+        '''
+        self.batch = None
+        snapshot = load_snapshot(path)
+        self.theta[:] = snapshot['theta']
+        self.episode = snapshot['episode']
+
+        self.E.clear()
+        if snapshot['trace'] is not None:
+            self.E.add(*snapshot['trace'])
+
+        extra = snapshot['extra']
+        if extra is not None:
+            self.rng.set_state(extra['agent_rng'])
+            self.env.rng.set_state(extra['env_rng'])
+            self.env.max_phase = extra['max_phase']
+            self.env.episode = extra['env_episode']
+            self.env.row_generator.set_state(extra['rows'])
+            if vector_env is not None and 'vector_env' in extra:
+                vector_env.set_state(extra['vector_env'])
+                self.batch = extra['batch']
+            if curriculum is not None and 'curriculum_rng' in extra:
+                curriculum.rng.set_state(extra['curriculum_rng'])
+            if self.replay is not None and 'replay' in extra:
+                self.replay.set_state(extra['replay'])
+        logger.info('resuming from %s (episode %d)', path, self.episode)
+
+    def train(self, instrumentation=None, checkpoints=None, max_steps=None,
+              curriculum=None, budget=None, renderer_toggle=None):
+        '''Trains until budget (a TrainingBudget) is exhausted, forever if
+           it is None.
+
+           Episodes are stopped after max_steps shots and start from the
+           depths chosen by curriculum (see curriculum.py), by default they
+           are normal games played until they are lost. A live view
+           requested through renderer_toggle (see renderer.RendererToggle)
+           is attached or detached between episodes.
+
+           Every 10 episodes a snapshot is saved by checkpoints (by default
+           a CheckpointManager that also updates THETA_OUTPUT) and the
+           throughput is logged. If an Instrumentation is given its stats
+           are written to PROFILE_OUTPUT after every episode (and to
+           PSTATS_OUTPUT with the checkpoints if it is profiling).
+        '''
+        if checkpoints is None:
+            checkpoints = CheckpointManager(theta_output=THETA_OUTPUT)
+        if budget is None:
+            budget = TrainingBudget()
+
+        start = time.time()
+        try:
+            with TrainingLog(LEVEL_OUTPUT) as training_log:
+                while not budget.exhausted():
+                    if renderer_toggle is not None:
+                        renderer_toggle.apply()
+                    depth = curriculum.sample() if curriculum else 1
+                    phase, reward = self.run_episode(max_steps, depth)
+                    budget.add(phase)
+
+                    if instrumentation is not None:
+                        instrumentation.dump(PROFILE_OUTPUT, self.episode)
+
+                    training_log.log(self.episode, phase, reward,
+                                     self.get_e(None), time.time() - start)
+                    self.episode += 1
+
+                    if self.episode % 10 == 0:
+                        self.save_checkpoint(checkpoints,
+                                             curriculum=curriculum)
+                        logger.info('Episode: %d (%.1f episodes/s, '
+                                    '%.1f steps/s)', self.episode,
+                                    *budget.rates())
+                        if self.env.shot_cache is not None:
+                            logger.info('shot cache: %s',
+                                        self.env.shot_cache.stats())
+                        if instrumentation is not None:
+                            instrumentation.dump_profile(PSTATS_OUTPUT)
+        finally:
+            # waits for the snapshots that are still being written
+            checkpoints.close()
+
+        return self.theta
+
+    def train_batched(self, vector_env, checkpoints=None, max_steps=None,
+                      budget=None, instrumentation=None):
+        '''Trains on the games of a VectorEnvironment until budget is
+           exhausted (forever if it is None).
+
+           Every game takes a step at the same time and the transitions are
+           learned with a single batch_update (one step Sarsa, the
+           eligibility trace is not used). Games that reach max_steps are
+           restarted, their last transition is not terminal. Finished games
+           are logged and checkpointed as in train, the snapshots are taken
+           between steps and include the games (see save_checkpoint), so
+           after restore(path, vector_env) the games are continued. The
+           stats of instrumentation are written with the checkpoints.
+        '''
+        if checkpoints is None:
+            checkpoints = CheckpointManager(theta_output=THETA_OUTPUT)
+        if budget is None:
+            budget = TrainingBudget()
+
+        start = time.time()
+        if self.batch is not None:
+            states = vector_env.bricks_matrix.copy()
+            actions = self.batch['actions']
+            lengths = self.batch['lengths']
+            self.batch = None
+        else:
+            states = vector_env.reset()
+            actions = self.policy_batch(states)
+            lengths = np.zeros(vector_env.num_envs, dtype=int)
+        try:
+            with TrainingLog(LEVEL_OUTPUT) as training_log:
+                while not budget.exhausted():
+                    next_states, rewards, dones = vector_env.step(actions)
+                    next_actions = self.policy_batch(next_states)
+                    self.batch_update(states, actions, rewards, next_states,
+                                      next_actions, dones)
+                    lengths += 1
+
+                    truncated = np.zeros_like(dones)
+                    if max_steps is not None:
+                        truncated = ~dones & (lengths >= max_steps)
+                    if np.any(truncated):
+                        next_states = vector_env.restart(truncated)
+                        next_actions[truncated] = self.policy_batch(
+                            next_states[truncated])
+
+                    finished = dones | truncated
+                    checkpoint = False
+                    for length, r in zip(lengths[finished], rewards[finished]):
+                        training_log.log(self.episode, length, r,
+                                         self.get_e(None), time.time() - start)
+                        budget.add(length)
+                        self.episode += 1
+                        if self.episode % 10 == 0:
+                            checkpoint = True
+                            logger.info('Episode: %d (%.1f episodes/s, '
+                                        '%.1f steps/s)', self.episode,
+                                        *budget.rates())
+                    lengths[finished] = 0
+
+                    states = next_states
+                    actions = next_actions
+                    if checkpoint:
+                        self.save_checkpoint(checkpoints, vector_env, actions,
+                                             lengths)
+                        if instrumentation is not None:
+                            instrumentation.dump(PROFILE_OUTPUT, self.episode)
+                            instrumentation.dump_profile(PSTATS_OUTPUT)
+        finally:
+            checkpoints.close()
+
+def parse_brick_values(text):
+    '''"1:0.6,2:0.3,4:0.1" -> {1: 0.6, 2: 0.3, 4: 0.1}'''
+    values = {}
+    for item in text.split(','):
+        value, probability = item.split(':')
+        values[int(value)] = float(probability)
+    return values
 
-        return self.get_value_function()
 
 def main():
-    env = Environment(ball_speed=15, state=GameState.AGENT_PLAYING)
-    agent = LinearFunctionSarsaAgent(env)
-    agent.train()
+    parser = argparse.ArgumentParser(description='Train the Sarsa agent.')
+    parser.add_argument('--headless', action='store_true',
+                        help='train without a window and without frame limit')
+    parser.add_argument('--render-every', type=int, default=None,
+                        help='in headless mode, draw every N-th episode')
+    parser.add_argument('--live', action='store_true',
+                        help='in headless mode, show the shots in another '
+                             'window without slowing training (kill -USR1 '
+                             'toggles it)')
+    parser.add_argument('--event-driven', action='store_true',
+                        help='solve shots analytically instead of per frame')
+    parser.add_argument('--balls', type=int, default=1,
+                        help='with --event-driven, balls launched per shot')
+    parser.add_argument('--brick-values', type=parse_brick_values,
+                        default=None,
+                        help='probabilities of the bricks values, for example '
+                             '1:0.6,2:0.3,4:0.1')
+    parser.add_argument('--shot-cache', type=int, default=0,
+                        help='with --event-driven, cache up to N shot outcomes')
+    parser.add_argument('--batched', type=int, default=0,
+                        help='train on N games at once (implies --headless)')
+    parser.add_argument('--replay', type=int, default=0,
+                        help='also learn from a replay buffer of N steps')
+    parser.add_argument('--replay-batch', type=int, default=32,
+                        help='minibatch size of the replay updates')
+    parser.add_argument('--prioritized', action='store_true',
+                        help='sample the replay buffer by TD error')
+    parser.add_argument('--instrument', action='store_true',
+                        help='write per episode hot path stats to %s'
+                        % PROFILE_OUTPUT)
+    parser.add_argument('--allocations', action='store_true',
+                        help='with --instrument, also record the memory '
+                             'allocated per function and per episode (the '
+                             'growth of the peak memory on python 2)')
+    parser.add_argument('--cprofile', action='store_true',
+                        help='also write cProfile stats to %s' % PSTATS_OUTPUT)
+    parser.add_argument('--resume', nargs='?', const='latest', default=None,
+                        help='resume from a checkpoint (default: the latest)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='makes the whole run reproducible')
+    parser.add_argument('--max-steps', type=int, default=None,
+                        help='stop (and restart) games after this many shots')
+    parser.add_argument('--episodes', type=int, default=None,
+                        help='stop training after this many episodes')
+    parser.add_argument('--time-budget', type=float, default=None,
+                        help='stop training after this many seconds')
+    parser.add_argument('--curriculum', type=int, default=0,
+                        help='start games with 1 to N rows of bricks')
+    parser.add_argument('--record', default=None,
+                        help='record every shot to this file (see '
+                             'trajectory.py)')
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help='-v shows progress, -vv every step')
+    args = parser.parse_args()
+    if args.balls > 1 and (args.batched or not args.event_driven):
+        # the frame by frame and the batched shots only know a single ball
+        parser.error('--balls needs --event-driven and no --batched')
+    if args.batched:
+        # train_batched only learns one step Sarsa from the vector games
+        ignored = [option for option, used in [
+            ('--record', args.record), ('--curriculum', args.curriculum),
+            ('--live', args.live), ('--replay', args.replay),
+            ('--render-every', args.render_every),
+            ('--shot-cache', args.shot_cache)] if used]
+        if ignored:
+            parser.error('%s can not be used with --batched'
+                         % ', '.join(ignored))
+    configure_logging(args.verbose)
+
+    # independent streams for the environment, the agent, the replay
+    # buffer, the batched games and the curriculum
+    seeds = [None] * 5
+    if args.seed is not None:
+        seeds = spawn_seeds(args.seed, 5)
+
+    recorder = None
+    if args.record:
+        # the replay simulates the shots the same way (see trajectory.py)
+        recorder = TrajectoryWriter(args.record, seed=seeds[0],
+                                    event_driven=args.event_driven,
+                                    ball_speed=physics.BALL_SPEED,
+                                    num_balls=args.balls,
+                                    values=args.brick_values is not None)
+    env = Environment(ball_speed=physics.BALL_SPEED,
+                      state=GameState.AGENT_PLAYING,
+                      headless=args.headless or args.batched > 0,
+                      render_every=args.render_every,
+                      event_driven=args.event_driven,
+                      shot_cache=ShotCache(args.shot_cache)
+                      if args.shot_cache else None, seed=seeds[0],
+                      recorder=recorder, num_balls=args.balls,
+                      brick_values=args.brick_values)
+    renderer_toggle = None
+    if env.headless:
+        # the live view runs in its own process and only gets snapshots
+        renderer_toggle = toggle_on_signal(env)
+        if args.live:
+            env.attach_renderer(Renderer().start())
+
+    replay = None
+    if args.replay:
+        replay = ReplayBuffer(args.replay, prioritized=args.prioritized,
+                              rng=make_rng(seeds[2]),
+                              values=args.brick_values is not None)
+    agent = LinearFunctionSarsaAgent(env, replay=replay,
+                                     replay_batch_size=args.replay_batch,
+                                     seed=seeds[1])
+
+    vector_env = None
+    if args.batched:
+        vector_env = VectorEnvironment(args.batched, seed=seeds[3],
+                                       brick_values=args.brick_values)
+    curriculum = None
+    if args.curriculum:
+        curriculum = Curriculum(range(1, args.curriculum + 1),
+                                rng=make_rng(seeds[4]))
+
+    checkpoints = CheckpointManager(theta_output=THETA_OUTPUT)
+    if args.resume:
+        path = args.resume
+        if path == 'latest':
+            path = checkpoints.latest()
+        if path is not None:
+            agent.restore(path, vector_env, curriculum)
+
+    instrumentation = None
+    if args.instrument or args.cprofile:
+        instrumentation = Instrumentation(track_allocations=args.allocations)
+        if args.instrument:
+            # the batched games do not use env
+            instrumentation.attach(env if vector_env is None else None,
+                                   agent)
+        if args.cprofile:
+            instrumentation.start_profile()
+    budget = TrainingBudget(args.episodes, args.time_budget)
+    if vector_env is not None:
+        agent.train_batched(vector_env, checkpoints, args.max_steps, budget,
+                            instrumentation)
+    else:
+        agent.train(instrumentation, checkpoints, args.max_steps, curriculum,
+                    budget, renderer_toggle)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,321 @@
+'''
+Copyright 2017 Marianne Linhares Monteiro, @mari-linhares at github.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import argparse
+import json
+import sys
+import time
+
+# for vectors manipulation
+import numpy as np
+
+from agent import LinearFunctionSarsaAgent
+from game import Ball, Environment, GameState
+import physics
+from seeding import make_rng, spawn_seeds
+from vector_env import VectorEnvironment
+
+# metrics ending with these suffixes are better when higher / lower
+HIGHER_IS_BETTER = '_per_sec'
+LOWER_IS_BETTER = '_us'
+
+
+def random_boards(rng, n, density=0.4):
+    '''n random (rows, cols) boards with an empty first row.'''
+    boards = (rng.random_sample((n, physics.NUM_ROWS, physics.NUM_COLS))
+              < density).astype(float)
+    boards[:, 0] = 0
+    return boards
+
+
+def time_per_call(fn, args_list):
+    '''Average microseconds per fn(*args) call.'''
+    start = time.time()
+    for args in args_list:
+        fn(*args)
+    return (time.time() - start) / len(args_list) * 1e6
+
+
+# ------- Benchmarks ----------
+def benchmark_shots(seed, shots, event_driven, ball_speed=15):
+    '''Shots per second of Environment.step (and frames per second).'''
+    env = Environment(ball_speed=ball_speed, state=GameState.AGENT_PLAYING,
+                      headless=True, event_driven=event_driven, seed=seed)
+    # count frames simulated by run()
+    frames = [0]
+    play_agent = env.play_agent
+
+    def counted_play_agent():
+        frames[0] += 1
+        return play_agent()
+    env.play_agent = counted_play_agent
+
+    actions = env.rng.randint(env.number_of_actions, size=shots)
+    env.next_phase()
+    start = time.time()
+    for a in actions:
+        env.step(None, a)
+    elapsed = time.time() - start
+
+    results = {'shots_per_sec': shots / elapsed}
+    if not event_driven:
+        results['frames_per_sec'] = frames[0] / elapsed
+    return results
+
+
+def benchmark_vector_shots(seed, num_envs, steps):
+    '''Shots per second of VectorEnvironment.step.'''
+    env = VectorEnvironment(num_envs, seed=seed)
+    env.reset()
+    actions = env.rng.randint(env.number_of_actions, size=(steps, num_envs))
+    start = time.time()
+    for a in actions:
+        env.step(a)
+    return {'shots_per_sec': num_envs * steps / (time.time() - start)}
+
+
+def benchmark_collisions(seed, calls):
+    '''Microseconds per Ball.check_rect_collision and physics.solve_shot.'''
+    rng = make_rng(seed)
+    env = Environment(state=GameState.AGENT_PLAYING, headless=True)
+    ball = Ball(physics.BALL_START, None, physics.TOP_LIMIT,
+                physics.FLOOR_LIMIT)
+    env.bricks_matrix = np.ones_like(env.bricks_matrix)
+    env.create_bricks()
+    rect = env.bricks[(4, 3)]
+
+    # positions around the brick, half of them colliding
+    xs = rng.uniform(rect.left - 16, rect.right + 16, size=calls)
+    ys = rng.uniform(rect.top - 16, rect.bottom + 16, size=calls)
+    angles = rng.choice(physics.ACTIONS, size=calls)
+
+    def check(x, y, angle):
+        ball.x, ball.y, ball.angle = x, y, angle
+        ball.check_rect_collision(rect)
+
+    boards = random_boards(rng, calls)
+    x, y = physics.BALL_START
+    return {
+        'check_rect_collision_us': time_per_call(check,
+                                                 zip(xs, ys, angles)),
+        'solve_shot_us': time_per_call(
+            physics.solve_shot,
+            [(b, x, y, a) for b, a in zip(boards, angles)]),
+    }
+
+
+def benchmark_volley(seed, calls, num_balls):
+    '''Microseconds per physics.solve_volley of num_balls balls.'''
+    rng = make_rng(seed)
+    values = rng.choice([1, 2, 4], (calls, physics.NUM_ROWS, physics.NUM_COLS))
+    boards = random_boards(rng, calls) * values
+    angles = rng.choice(physics.ACTIONS, size=calls)
+    x, y = physics.BALL_START
+    return {'solve_volley_us': time_per_call(
+        physics.solve_volley,
+        [(b, x, y, a, num_balls) for b, a in zip(boards, angles)])}
+
+
+def benchmark_rows(seed, calls):
+    '''Microseconds per Environment.create_next_row.'''
+    env = Environment(state=GameState.AGENT_PLAYING, headless=True,
+                      seed=seed)
+    return {'create_next_row_us': time_per_call(env.create_next_row,
+                                                [()] * calls)}
+
+
+def benchmark_agent(seed, calls, episodes):
+    '''Agent policy and update costs, and episodes per second.'''
+    rng = make_rng(seed)
+    env_seed, agent_seed = spawn_seeds(seed, 2)
+    env = Environment(state=GameState.AGENT_PLAYING, headless=True,
+                      event_driven=True, seed=env_seed)
+    agent = LinearFunctionSarsaAgent(
+        env, theta=rng.randn(env.bricks_matrix.size *
+                             env.number_of_actions) * 0.1, seed=agent_seed)
+    boards = random_boards(rng, calls)
+    actions = rng.randint(env.number_of_actions, size=calls)
+
+    def update(s, a):
+        idx, values = agent.active_features(s, a)
+        agent.E.add(idx, values)
+        agent.update_theta(0.01 * rng.randn())
+        agent.E.decay(agent.disc_factor * agent._lambda)
+
+    results = {
+        'policy_us': time_per_call(agent.policy, [(b,) for b in boards]),
+        'update_us': time_per_call(update, zip(boards, actions)),
+    }
+
+    steps = 0
+    start = time.time()
+    for _ in range(episodes):
+        steps += agent.run_episode()[0]
+    elapsed = time.time() - start
+
+    results['episodes_per_sec'] = episodes / elapsed
+    results['steps_per_sec'] = steps / elapsed
+    return results
+
+
+def run(seed=0, scale=1.0):
+    '''Runs every benchmark, scale multiplies the amount of work.'''
+    def n(x):
+        return max(1, int(x * scale))
+
+    benchmarks = [
+        ('env_event', lambda s: benchmark_shots(s, n(500), True)),
+        ('env_frames', lambda s: benchmark_shots(s, n(50), False)),
+        ('vector_env', lambda s: benchmark_vector_shots(s, 1000, n(20))),
+        ('physics', lambda s: benchmark_collisions(s, n(5000))),
+        ('volley', lambda s: benchmark_volley(s, n(50), 10)),
+        ('rows', lambda s: benchmark_rows(s, n(5000))),
+        ('agent', lambda s: benchmark_agent(s, n(5000), n(20))),
+    ]
+
+    results = {}
+    for name, benchmark in benchmarks:
+        # every benchmark has its own generators seeded by seed, so they
+        # do not depend on each other
+        for metric, value in benchmark(seed).items():
+            results['%s.%s' % (name, metric)] = value
+    return results
+
+
+# ------- Checks ----------
+# physics.solve_shot and the frame by frame run() can still differ on a few
+# shots (see solve_shot), this is the fraction of shots check_shots accepts
+CHECK_TOLERANCE = 0.03
+
+
+def check_shots(seed=0, num_boards=60, ball_speed=2):
+    '''Compares physics.solve_shot with the frame by frame run() of every
+       action on an empty board (the floor positions must agree within one
+       frame of movement) and on num_boards random boards (the bricks after
+       the shot must be the same).
+
+       The slower the ball the closer the frame by frame simulation is to
+       the event driven one, at the training speed (physics.BALL_SPEED) a
+       few more shots differ.
+
+       Returns the (board, action) pairs that do not agree and the number of
+       shots compared.
+    '''
+    boards = random_boards(make_rng(seed), num_boards)
+    # a brick in the last row means the game was already lost
+    boards[:, -1] = 0
+    boards = [('empty', np.zeros((physics.NUM_ROWS, physics.NUM_COLS)))] + \
+        [('board %d' % i, board) for i, board in enumerate(boards)]
+
+    x, y = physics.BALL_START
+    mismatches = []
+    for name, board in boards:
+        for a, angle in enumerate(physics.ACTIONS):
+            env = Environment(ball_speed=ball_speed,
+                              state=GameState.AGENT_PLAYING, headless=True)
+            env.bricks_matrix = board.copy()
+            env.ball.set_angle(angle)
+            _, frames_board, _ = env.run()
+            floor_x, bricks, _ = physics.solve_shot(board, x, y, angle)
+
+            same = np.array_equal(frames_board.to_array(), bricks)
+            if not board.any():
+                same = same and abs(floor_x - env.ball.x) <= ball_speed
+            if not same:
+                mismatches.append((name, a))
+    return mismatches, len(boards) * len(physics.ACTIONS)
+
+
+def compare(results, baseline, tolerance=0.2):
+    '''Returns the metrics that are worse than baseline by more than
+       tolerance (a fraction of the baseline value).
+    '''
+    regressions = []
+    for metric in sorted(results):
+        if metric not in baseline:
+            continue
+        old, new = baseline[metric], results[metric]
+        if metric.endswith(HIGHER_IS_BETTER):
+            worse = new < old * (1 - tolerance)
+        elif metric.endswith(LOWER_IS_BETTER):
+            worse = new > old * (1 + tolerance)
+        else:
+            worse = False
+        if worse:
+            regressions.append((metric, old, new))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput benchmarks.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='multiplies the amount of work of every benchmark')
+    parser.add_argument('--save', default=None,
+                        help='save the results to this JSON file')
+    parser.add_argument('--compare', default=None,
+                        help='compare the results with this JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative slowdown before flagging')
+    parser.add_argument('--check', action='store_true',
+                        help='only check that the event driven shots agree '
+                             'with the frame by frame ones')
+    parser.add_argument('--check-speed', type=int, default=2,
+                        help='with --check, ball speed of the frame by '
+                             'frame shots')
+    args = parser.parse_args()
+
+    if args.check:
+        mismatches, shots = check_shots(args.seed,
+                                        ball_speed=args.check_speed)
+        for name, action in mismatches:
+            print 'MISMATCH %s, action %d' % (name, action)
+        rate = len(mismatches) / float(shots)
+        print '%d of %d shots differ (%.1f%%)' % (len(mismatches), shots,
+                                                   100 * rate)
+        if rate > CHECK_TOLERANCE or any(name == 'empty'
+                                         for name, _ in mismatches):
+            sys.exit(1)
+        print 'event driven and frame by frame shots agree'
+        return
+
+    results = run(args.seed, args.scale)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    for metric in sorted(results):
+        line = '%-35s %14.2f' % (metric, results[metric])
+        if metric in baseline:
+            change = results[metric] / baseline[metric] - 1
+            line += '  (%+.1f%%)' % (100 * change)
+        print line
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        regressions = compare(results, baseline, args.tolerance)
+        for metric, old, new in regressions:
+            print 'REGRESSION %s: %.2f -> %.2f' % (metric, old, new)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+'''
+Copyright 2017 Marianne Linhares Monteiro, @mari-linhares at github.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# for vectors manipulation
+import numpy as np
+
+from physics import NUM_ROWS, NUM_COLS
+
+NUM_CELLS = NUM_ROWS * NUM_COLS
+ROW_MASK = (1 << NUM_COLS) - 1
+FULL_MASK = (1 << NUM_CELLS) - 1
+LAST_ROW_MASK = ROW_MASK << (NUM_CELLS - NUM_COLS)
+
+# bit i of a packed board is cell i of the flattened bricks_matrix
+BIT_VALUES = np.left_shift(np.uint64(1), np.arange(NUM_CELLS, dtype=np.uint64))
+
+
+def pack(matrix):
+    '''Packs a 0/1 board (any shape with NUM_CELLS cells) in an int.'''
+    cells = np.ravel(matrix) != 0
+    return int(BIT_VALUES[cells].sum())
+
+
+def unpack(bits, dtype=float):
+    '''Inverse of pack, returns a (rows, cols) tensor.'''
+    cells = (np.uint64(bits) & BIT_VALUES) != 0
+    return cells.astype(dtype).reshape(NUM_ROWS, NUM_COLS)
+
+
+def row_bits(row):
+    '''Packs a single row.'''
+    bits = 0
+    for c, v in enumerate(row):
+        if v:
+            bits |= 1 << c
+    return bits
+
+
+class BitBoard():
+    '''Immutable board with 0/1 bricks packed in a single 63 bits integer.
+
+       It is hashable, so it can be used as a dictionary key, and it uses
+       8 bytes where a float bricks_matrix uses 504. Its features are only
+       computed the first time they are needed (the agent asks for them
+       several times per step).
+    '''
+    __slots__ = ('bits', '_features')
+
+    def __init__(self, bits=0):
+        self.bits = int(bits)
+        self._features = None
+
+    @classmethod
+    def from_array(cls, matrix):
+        return cls(pack(matrix))
+
+    def to_array(self, dtype=float):
+        return unpack(self.bits, dtype)
+
+    def __eq__(self, other):
+        return isinstance(other, BitBoard) and self.bits == other.bits
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.bits)
+
+    def __repr__(self):
+        return 'BitBoard(%#x)' % self.bits
+
+    def __getitem__(self, cell):
+        r, c = cell
+        return (self.bits >> (r * NUM_COLS + c)) & 1
+
+    def shift_down(self):
+        '''Moves every brick one row below, the last row is dropped.'''
+        return BitBoard((self.bits << NUM_COLS) & FULL_MASK)
+
+    def insert_row(self, row):
+        '''Same as Environment.create_next_row with a given row: bricks go
+           one row below and row becomes the second row.
+        '''
+        bits = self.shift_down().bits
+        bits &= ~(ROW_MASK << NUM_COLS)
+        return BitBoard(bits | (row_bits(row) << NUM_COLS))
+
+    def hit(self, r, c):
+        '''Board after the brick at (r, c) is hit once.'''
+        return BitBoard(self.bits & ~(1 << (r * NUM_COLS + c)))
+
+    def is_terminal(self):
+        '''True if there are bricks in the last row (game over).'''
+        return bool(self.bits & LAST_ROW_MASK)
+
+    def cells(self):
+        '''Flat indexes of the cells with bricks (an array), in increasing
+           order. The bits are tested all at once, not one by one.
+        '''
+        return np.flatnonzero(np.uint64(self.bits) & BIT_VALUES)
+
+    def active_cells(self):
+        '''Flat indexes of the cells with bricks, in increasing order.'''
+        return self.cells().tolist()
+
+    def features(self):
+        '''Indexes and values of the non zero cells (see agent phi), as
+           read-only arrays.
+        '''
+        if self._features is None:
+            cells = self.cells()
+            values = np.ones(cells.size)
+            cells.flags.writeable = values.flags.writeable = False
+            self._features = cells, values
+        return self._features
+
+
+class ValueBoard():
+    '''Immutable board for bricks with values above 1 (uint8 per cell).
+
+       Same interface as BitBoard, it is the fallback used by make_board.
+    '''
+    __slots__ = ('values', 'key', '_features')
+
+    def __init__(self, values):
+        self.values = np.array(values, dtype=np.uint8).reshape(NUM_ROWS,
+                                                               NUM_COLS)
+        self.values.flags.writeable = False
+        self.key = self.values.tostring()
+        self._features = None
+
+    @classmethod
+    def from_array(cls, matrix):
+        return cls(matrix)
+
+    def to_array(self, dtype=float):
+        return self.values.astype(dtype)
+
+    def __eq__(self, other):
+        return isinstance(other, ValueBoard) and self.key == other.key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return 'ValueBoard(%r)' % self.values.tolist()
+
+    def __getitem__(self, cell):
+        return int(self.values[cell])
+
+    def shift_down(self):
+        values = np.zeros_like(self.values)
+        values[1:] = self.values[:-1]
+        return ValueBoard(values)
+
+    def insert_row(self, row):
+        values = self.shift_down().values.copy()
+        values[1] = row
+        return ValueBoard(values)
+
+    def hit(self, r, c):
+        values = self.values.copy()
+        if values[r, c] > 0:
+            values[r, c] -= 1
+        return ValueBoard(values)
+
+    def is_terminal(self):
+        return bool(np.any(self.values[-1]))
+
+    def active_cells(self):
+        return np.flatnonzero(self.values).tolist()
+
+    def features(self):
+        if self._features is None:
+            cells = np.flatnonzero(self.values)
+            values = self.values.ravel()[cells].astype(float)
+            cells.flags.writeable = values.flags.writeable = False
+            self._features = cells, values
+        return self._features
+
+
+def make_board(matrix):
+    '''Compact board for a bricks_matrix: a BitBoard if every brick has
+       value 1, a ValueBoard otherwise.
+    '''
+    matrix = np.asarray(matrix)
+    # bricks values are non negative integers
+    if matrix.max() <= 1:
+        return BitBoard.from_array(matrix)
+    return ValueBoard.from_array(matrix)
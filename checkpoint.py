@@ -0,0 +1,182 @@
+'''
+Copyright 2017 Marianne Linhares Monteiro, @mari-linhares at github.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import glob
+import logging
+import os
+import pickle
+import tempfile
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# for vectors manipulation
+import numpy as np
+
+CHECKPOINT_DIR = 'checkpoints'
+CHECKPOINT_NAME = 'theta-%09d.npz'
+
+# os.rename does not overwrite files on windows
+replace = getattr(os, 'replace', os.rename)
+
+# the umask can only be read by setting it, it is read once here instead of
+# while the checkpoint thread may be creating files
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+logger = logging.getLogger(__name__)
+
+
+def file_mode(path):
+    '''Permissions for path: the ones of the existing file, or the default
+       ones of a new file (mkstemp files are only readable by the owner).
+    '''
+    try:
+        return os.stat(path).st_mode & 0o777
+    except OSError:
+        return 0o666 & ~UMASK
+
+
+def atomic_write(path, write):
+    '''Calls write(f) on a temporary file that is renamed to path only
+       after it was completely written, so path is never left half written.
+    '''
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, file_mode(path))
+        replace(tmp_path, path)
+    except:
+        os.remove(tmp_path)
+        raise
+
+
+def save_snapshot(path, snapshot):
+    '''Writes a snapshot (see CheckpointManager.save) as a .npz file.'''
+    arrays = {'theta': snapshot['theta'],
+              'episode': np.array(snapshot.get('episode', 0))}
+    if snapshot.get('trace') is not None:
+        arrays['trace_indexes'], arrays['trace_values'] = snapshot['trace']
+    if snapshot.get('extra') is not None:
+        # pickled bytes stored as uint8, np.load never has to unpickle
+        extra = pickle.dumps(snapshot['extra'], protocol=2)
+        arrays['extra'] = np.frombuffer(extra, dtype=np.uint8)
+    atomic_write(path, lambda f: np.savez(f, **arrays))
+
+
+def load_snapshot(path):
+    '''Reads a snapshot written by save_snapshot.'''
+    with np.load(path) as data:
+        snapshot = {'theta': data['theta'],
+                    'episode': int(data['episode']),
+                    'trace': None,
+                    'extra': None}
+        if 'trace_indexes' in data:
+            snapshot['trace'] = data['trace_indexes'], data['trace_values']
+        if 'extra' in data:
+            snapshot['extra'] = pickle.loads(data['extra'].tostring())
+    return snapshot
+
+
+class CheckpointManager():
+    '''Writes versioned snapshots of the training state in the background.
+
+       save() only copies the state, the files are written by a thread.
+       Every file is written atomically (temporary file + rename), only the
+       last keep versions are kept and theta_output (if given) is updated
+       with the latest theta so it can still be used by np.load.
+    '''
+    def __init__(self, directory=CHECKPOINT_DIR, keep=5, theta_output=None):
+        self.directory = directory
+        self.keep = keep
+        self.theta_output = theta_output
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.write_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def save(self, episode, theta, trace=None, extra=None):
+        '''Schedules a snapshot, returns without waiting for the disk.
+
+            Args:
+                episode (int): number of episodes trained so far.
+                theta (tensor): parameters (copied).
+                trace (tuple): eligibility trace as (indexes, values).
+                extra (object): anything else to restore (e.g. RNG states),
+                    it must be picklable.
+        '''
+        self.queue.put({'episode': episode, 'theta': np.array(theta),
+                        'trace': trace, 'extra': extra})
+
+    def write_loop(self):
+        while True:
+            snapshot = self.queue.get()
+            try:
+                if snapshot is None:
+                    return
+                self.write(snapshot)
+            except Exception:
+                logger.exception('could not write checkpoint')
+            finally:
+                self.queue.task_done()
+
+    def write(self, snapshot):
+        path = os.path.join(self.directory,
+                            CHECKPOINT_NAME % snapshot['episode'])
+        save_snapshot(path, snapshot)
+        if self.theta_output:
+            atomic_write(self.theta_output,
+                         lambda f: np.save(f, snapshot['theta']))
+
+        for old in self.checkpoints()[:-self.keep]:
+            os.remove(old)
+        logger.info('saved %s', path)
+
+    def wait(self):
+        '''Blocks until every scheduled snapshot is on disk.'''
+        self.queue.join()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def checkpoints(self):
+        '''Paths of the existing snapshots, oldest first.'''
+        return sorted(glob.glob(os.path.join(self.directory,
+                                             CHECKPOINT_NAME.replace('%09d',
+                                                                     '*'))))
+
+    def latest(self):
+        '''Path of the newest snapshot, or None.'''
+        paths = self.checkpoints()
+        return paths[-1] if paths else None
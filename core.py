@@ -0,0 +1,220 @@
+'''
+Copyright 2017 Marianne Linhares Monteiro, @mari-linhares at github.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# for vectors manipulation
+import numpy as np
+
+# only pygame free modules can be imported here
+import physics
+from rows import RingBoard, RowGenerator
+from seeding import make_rng
+
+# reward of the shot that loses the game, every other shot gets 0
+LOSS_REWARD = -1
+
+
+# ------- Functions ----------
+def is_lost(bricks_matrix):
+    '''True if there are bricks in the last row (the game is over).
+
+       Works with a single board and with (N, rows, cols) tensors.
+    '''
+    return np.any(np.asarray(bricks_matrix)[..., -1, :] != 0, axis=-1)
+
+
+def rewards(lost):
+    '''Reward of the shots given if they lost their game.'''
+    return np.where(lost, LOSS_REWARD, 0)
+
+
+def insert_rows(bricks_matrix, rows):
+    '''Moves every brick one row below (the last row, empty unless the game
+       is lost, becomes the first one) and rows become the second row.
+
+       Works with (N, rows, cols) tensors, a new tensor is returned.
+    '''
+    bricks_matrix = np.roll(bricks_matrix, 1, axis=-2)
+    bricks_matrix[..., 1, :] = rows
+    return bricks_matrix
+
+
+def core_property(name):
+    '''Attribute of an object that is stored in its GameCore (self.core).'''
+    def get(self):
+        return getattr(self.core, name)
+
+    def set(self, value):
+        setattr(self.core, name, value)
+    return property(get, set)
+
+
+# ------- Classes ----------
+class GameCore(object):
+    '''Rules of one game when an agent is playing, without pygame.
+
+       game.Environment, gym_env.BrickBlastEnv and evaluate play their games
+       through it, VectorEnvironment applies the same rules (is_lost,
+       insert_rows) to N boards at once.
+
+       Args:
+           seed (int): seed of self.rng, every random decision uses it.
+           brick_values (dict): value -> probability of the bricks values
+               (see RowGenerator).
+           num_balls (int): balls launched per shot (see
+               physics.solve_volley).
+           shot_cache (ShotCache): optional cache of single ball shots.
+           recorder (TrajectoryWriter): optional, records every shot.
+    '''
+    def __init__(self, seed=None, brick_values=None, num_balls=1,
+                 shot_cache=None, recorder=None):
+        self.actions = physics.ACTIONS
+        self.num_balls = num_balls
+        self.shot_cache = shot_cache
+        self.recorder = recorder
+        # optional renderer.Renderer showing the shots in another process
+        self.renderer = None
+
+        self.rng = make_rng(seed)
+        # random rows and the board they are inserted in
+        self.row_generator = RowGenerator(values=brick_values, rng=self.rng)
+        self.ring_board = RingBoard(physics.NUM_ROWS, physics.NUM_COLS)
+        # stores the bricks values (a view on self.ring_board)
+        self.bricks_matrix = self.ring_board.view
+
+        self.phase = 0
+        # max phase ever seen and number of games started so far
+        self.max_phase = 0
+        self.episode = 0
+
+    def seed(self, seed):
+        '''Restarts the random rows from seed.'''
+        self.rng.seed(seed)
+        # rows pre-generated with the old seed are dropped
+        self.row_generator.set_state(np.zeros((0, physics.NUM_COLS)))
+
+    def new_game(self):
+        '''Starts a game with an empty board (see next_phase and prefill).'''
+        self.episode += 1
+        self.phase = 0
+        self.ring_board.reset()
+        self.bricks_matrix = self.ring_board.view
+
+    def insert_row(self, row=None):
+        '''Moves the bricks one row below and adds row (a random one if
+           None) as the second row.
+        '''
+        if row is None:
+            row = self.row_generator.next_row()
+
+        # bricks_matrix may have been replaced by another tensor
+        if self.bricks_matrix is not self.ring_board.view:
+            self.ring_board.load(self.bricks_matrix)
+
+        # the ring board does it without copying the whole matrix
+        self.ring_board.insert_row(row)
+        self.bricks_matrix = self.ring_board.view
+
+    def next_phase(self, row=None):
+        self.insert_row(row)
+        self.phase += 1
+
+    def prefill(self, depth):
+        '''Starts the game with depth rows of bricks (depth phases without
+           shooting), prefill(1) is the same as next_phase().
+        '''
+        if not 1 <= depth <= physics.NUM_ROWS - 2:
+            raise ValueError('depth must be between 1 and %d'
+                             % (physics.NUM_ROWS - 2))
+        for _ in range(depth):
+            self.next_phase()
+
+    def is_lost(self):
+        return bool(is_lost(self.bricks_matrix))
+
+    def shoot(self, action, path=None):
+        '''Solves a shot with angle self.actions[action] from the start
+           position and updates bricks_matrix.
+
+           The outcome is taken from self.shot_cache when possible, which
+           does not keep the path of the ball (path is filled as in
+           physics.solve_shot, volleys do not fill it). Returns the number
+           of bricks hit.
+        '''
+        x, y = physics.BALL_START
+        angle = self.actions[action]
+        if self.num_balls > 1:
+            _, bricks, hits = physics.solve_volley(self.bricks_matrix, x, y,
+                                                   angle, self.num_balls)
+            hits = int(hits.sum())
+        elif self.shot_cache is not None and path is None:
+            _, bricks, hits = self.shot_cache.resolve(self.bricks_matrix,
+                                                      action)
+        else:
+            _, bricks, hits = physics.solve_shot(self.bricks_matrix, x, y,
+                                                 angle, path=path)
+        self.bricks_matrix[:] = bricks
+        return hits
+
+    def step(self, action, row=None, simulate=None):
+        '''Plays the shot with angle self.actions[action].
+
+           If the game is not lost the next phase starts with row (a random
+           one if None). A lost game is not restarted, its last board stays
+           in bricks_matrix until new_game is called.
+
+            Args:
+                action (int): index of an action in self.actions.
+                row (tensor): row created after the shot (used to replay
+                    recorded episodes).
+                simulate (function): if given it is called to play the shot
+                    instead of shoot (it must update bricks_matrix), used by
+                    Environment to move the ball frame by frame.
+            Returns:
+                reward (int): LOSS_REWARD if the game was lost, 0 otherwise.
+                hits (int): number of bricks hit (None with simulate).
+        '''
+        # read once, so a recorder or renderer attached during the shot is
+        # only used from the next one
+        recorder, renderer = self.recorder, self.renderer
+        if recorder is not None or renderer is not None:
+            # state before the shot, sent once its reward is known
+            episode, step = self.episode, self.phase
+            board = self.bricks_matrix.copy()
+
+        path = None
+        if simulate is not None:
+            simulate()
+            hits = None
+        else:
+            # the path of a single ball is drawn by the renderer
+            if renderer is not None and self.num_balls == 1:
+                path = []
+            hits = self.shoot(action, path)
+
+        lost = self.is_lost()
+        reward = LOSS_REWARD if lost else 0
+        if renderer is not None:
+            after_shot = self.bricks_matrix.copy()
+        if lost:
+            self.max_phase = max(self.phase, self.max_phase)
+        else:
+            self.next_phase(row)
+
+        if recorder is not None:
+            recorder.record(episode, step, board, action, reward)
+        if renderer is not None:
+            renderer.submit(board, path, after_shot, step, self.max_phase)
+        return reward, hits
@@ -0,0 +1,88 @@
+'''
+Copyright 2017 Marianne Linhares Monteiro, @mari-linhares at github.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import time
+
+# for vectors manipulation
+import numpy as np
+
+from physics import NUM_ROWS
+from seeding import make_rng
+
+# the last row must be empty, otherwise the game is already lost
+MAX_DEPTH = NUM_ROWS - 2
+
+
+class Curriculum():
+    '''Chooses how many rows of bricks each episode starts with.
+
+       Games that start from full boards reach the interesting (dangerous)
+       states right away instead of replaying the easy beginning that a
+       good policy already knows, see Environment.prefill.
+
+       Args:
+           depths (list): possible initial depths, from 1 (a normal game)
+               to MAX_DEPTH.
+           weights (list): relative probability of each depth, uniform by
+               default.
+           rng: np.random.RandomState, a new one seeded from the OS by
+               default.
+    '''
+    def __init__(self, depths=range(1, MAX_DEPTH + 1), weights=None,
+                 rng=None):
+        self.depths = np.array(depths, dtype=int)
+        if self.depths.min() < 1 or self.depths.max() > MAX_DEPTH:
+            raise ValueError('depths must be between 1 and %d' % MAX_DEPTH)
+
+        weights = np.ones(self.depths.size) if weights is None else weights
+        self.probabilities = np.array(weights, dtype=float)
+        self.probabilities /= self.probabilities.sum()
+        self.rng = rng if rng is not None else make_rng(None)
+
+    def sample(self):
+        return int(self.rng.choice(self.depths, p=self.probabilities))
+
+
+class TrainingBudget():
+    '''Limits a training run by episodes and/or wall time (None means no
+       limit) and measures its throughput.
+    '''
+    def __init__(self, episodes=None, seconds=None):
+        self.max_episodes = episodes
+        self.max_seconds = seconds
+        self.start = time.time()
+        self.episodes = 0
+        self.steps = 0
+
+    def add(self, steps):
+        '''Counts a finished episode with this many steps.'''
+        self.episodes += 1
+        self.steps += steps
+
+    def elapsed(self):
+        return time.time() - self.start
+
+    def exhausted(self):
+        if (self.max_episodes is not None and
+                self.episodes >= self.max_episodes):
+            return True
+        return (self.max_seconds is not None and
+                self.elapsed() >= self.max_seconds)
+
+    def rates(self):
+        '''(episodes per second, steps per second) since the start.'''
+        elapsed = max(self.elapsed(), 1e-9)
+        return self.episodes / elapsed, self.steps / elapsed
@@ -0,0 +1,162 @@
+'''
+Copyright 2017 Marianne Linhares Monteiro, @mari-linhares at github.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import argparse
+import json
+import multiprocessing
+import time
+
+# for vectors manipulation
+import numpy as np
+
+from core import GameCore, LOSS_REWARD
+from inference import GreedyPolicy, THETA_OUTPUT
+import physics
+from seeding import spawn_seeds
+
+PERCENTILES = (10, 25, 75, 90)
+
+# policy of the current worker process, created by init_worker
+worker_policy = None
+
+
+def play_episode(policy, seed, max_steps=1000, ball_speed=None):
+    '''Plays one greedy game, same rules as Environment when an agent is
+       playing. The rows of the game only depend on seed.
+
+       Shots are event driven (see physics.solve_shot) unless ball_speed is
+       given, then they are simulated frame by frame by a headless
+       Environment, which is how agent.py trains by default (the two can
+       differ, see benchmark.check_shots).
+
+        Returns:
+            length (int): number of phases played.
+            truncated (bool): True if the game was stopped at max_steps.
+    '''
+    if ball_speed is not None:
+        # pygame is only imported when it is needed
+        from game import Environment, GameState
+        game = Environment(ball_speed=ball_speed,
+                           state=GameState.AGENT_PLAYING, headless=True,
+                           seed=seed)
+    else:
+        game = GameCore(seed)
+        game.new_game()
+    game.next_phase()
+
+    for length in xrange(1, max_steps + 1):
+        action = policy.choose_best_action(game.bricks_matrix)
+        if ball_speed is not None:
+            _, reward = game.step(None, action)
+        else:
+            reward, _ = game.step(action)
+        if reward == LOSS_REWARD:
+            return length, False
+    return max_steps, True
+
+
+def init_worker(path, mmap):
+    global worker_policy
+    worker_policy = GreedyPolicy(path=path, mmap=mmap)
+
+
+def run_episode(args):
+    seed, max_steps, ball_speed = args
+    return play_episode(worker_policy, seed, max_steps, ball_speed)
+
+
+def summarize(lengths, truncated, seconds):
+    lengths = np.asarray(lengths)
+    results = {'episodes': lengths.size,
+               'mean': lengths.mean(),
+               'std': lengths.std(),
+               'median': np.median(lengths),
+               'min': lengths.min(),
+               'max': lengths.max(),
+               'truncated': int(np.sum(truncated)),
+               'episodes_per_sec': lengths.size / seconds,
+               'steps_per_sec': lengths.sum() / seconds}
+    for p in PERCENTILES:
+        results['p%d' % p] = np.percentile(lengths, p)
+    # plain floats, so the results can be saved as JSON
+    return dict((k, float(v)) for k, v in results.items())
+
+
+def evaluate(path=THETA_OUTPUT, episodes=1000, seed=0, max_steps=1000,
+             num_workers=None, mmap=True, ball_speed=None):
+    '''Scores the greedy policy of theta saved at path.
+
+       Episode i is played with rows from stream i of seed (see
+       seeding.spawn_seeds), so the results do not depend on the number of
+       workers. Every worker memory maps the
+       same theta file (with mmap). With ball_speed the shots are simulated
+       frame by frame (see play_episode).
+    '''
+    num_workers = num_workers or multiprocessing.cpu_count()
+    tasks = [(s, max_steps, ball_speed) for s in spawn_seeds(seed, episodes)]
+
+    start = time.time()
+    if num_workers == 1:
+        init_worker(path, mmap)
+        outcomes = [run_episode(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(num_workers, initializer=init_worker,
+                                    initargs=(path, mmap))
+        try:
+            chunksize = max(1, episodes // (4 * num_workers))
+            outcomes = pool.map(run_episode, tasks, chunksize)
+        finally:
+            pool.close()
+            pool.join()
+    seconds = time.time() - start
+
+    lengths, truncated = zip(*outcomes)
+    return summarize(lengths, truncated, seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Evaluate the greedy policy of a trained agent.')
+    parser.add_argument('theta', nargs='?', default=THETA_OUTPUT,
+                        help='theta file saved with np.save')
+    parser.add_argument('--episodes', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-steps', type=int, default=1000,
+                        help='episodes longer than this are truncated')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default: all cores)')
+    parser.add_argument('--save', default=None,
+                        help='save the results to this JSON file')
+    parser.add_argument('--frames', action='store_true',
+                        help='simulate the shots frame by frame, like '
+                             'agent.py trains without --event-driven '
+                             '(needs pygame, much slower)')
+    parser.add_argument('--ball-speed', type=int, default=physics.BALL_SPEED,
+                        help='with --frames, pixels the ball moves per frame')
+    args = parser.parse_args()
+
+    results = evaluate(args.theta, args.episodes, args.seed, args.max_steps,
+                       args.workers,
+                       ball_speed=args.ball_speed if args.frames else None)
+    for metric in sorted(results):
+        print '%-20s %14.2f' % (metric, results[metric])
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+if __name__ == "__main__":
+    main()
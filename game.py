@@ -15,7 +15,6 @@ limitations under the License.
 '''
 
 # -------- Imports ------------
-import copy
 from enum import Enum
 import math
 import sys
@@ -23,18 +22,18 @@ import sys
 import numpy as np
 import pygame
 
-# --------- Constants ---------
-# screen
-BLOCK_SIZE = 64
-NUM_BLOCKS_Y = 10
-NUM_BLOCKS_X = 7
-SCREEN_SIZE = BLOCK_SIZE * NUM_BLOCKS_X, BLOCK_SIZE * NUM_BLOCKS_Y + 100
+from board import make_board
+from core import GameCore, LOSS_REWARD, core_property
+import physics
+from physics import BLOCK_SIZE, NUM_BLOCKS_Y, NUM_BLOCKS_X, SCREEN_SIZE
 
+# --------- Constants ---------
 # color constants
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
 BLUE = (0, 0, 255)
 BRICK_COLOR = {1: (221, 218, 94), 2: (90, 185, 186), 3: (1, 161, 247), 4: (237, 134, 186)}
+MAX_COLOR = max(BRICK_COLOR)
 
 
 # ------- Classes ----------
@@ -156,31 +155,100 @@ class Ball():
  
         return colision
 
-class Environment:
+class SpriteCache():
+    '''Surfaces of the bricks and of the texts, each one is rendered once
+       and then only blitted.
+    '''
+    # texts are forgotten after this many different ones (stats change)
+    MAX_TEXTS = 256
+
+    def __init__(self, font):
+        self.font = font
+        self.bricks = {}
+        self.texts = {}
+
+    def brick(self, v, border_size=10):
+        '''Brick with value v, with its border and its value written.'''
+        surface = self.bricks.get(v)
+        if surface is None:
+            surface = pygame.Surface((BLOCK_SIZE, BLOCK_SIZE))
+            surface.fill(WHITE)
+            rect = pygame.Rect(border_size/2.0, border_size/2.0,
+                               BLOCK_SIZE - border_size,
+                               BLOCK_SIZE - border_size)
+            # bricks above the last color share it
+            pygame.draw.rect(surface, BRICK_COLOR[min(v, MAX_COLOR)], rect)
+            glyph = self.text(str(v), BLACK, True)
+            surface.blit(glyph, ((BLOCK_SIZE - glyph.get_width())/2.0,
+                                 (BLOCK_SIZE - glyph.get_height())/2.0))
+            self.bricks[v] = surface
+        return surface
+
+    def text(self, s, colour=WHITE, antialias=False):
+        key = s, colour, antialias
+        surface = self.texts.get(key)
+        if surface is None:
+            if len(self.texts) >= self.MAX_TEXTS:
+                self.texts.clear()
+            surface = self.font.render(s, antialias, colour)
+            self.texts[key] = surface
+        return surface
+
+
+class Environment(object):
     '''Brick blast ball environment.
        This class not only has all the pygame code to physics and drawing, but
        also has what is needed to interact with an agent.
+
+       The board, the rows and the rules an agent plays with are kept by a
+       core.GameCore (self.core), the attributes below are stored there.
     '''
-    def __init__(self, ball_speed=10, state=GameState.MENU):
-        pygame.init()
+    bricks_matrix = core_property('bricks_matrix')
+    phase = core_property('phase')
+    max_phase = core_property('max_phase')
+    episode = core_property('episode')
+    rng = core_property('rng')
+    row_generator = core_property('row_generator')
+    ring_board = core_property('ring_board')
+    shot_cache = core_property('shot_cache')
+    num_balls = core_property('num_balls')
+    recorder = core_property('recorder')
+    renderer = core_property('renderer')
+
+    def __init__(self, ball_speed=10, state=GameState.MENU, headless=False,
+                 render_every=None, event_driven=False, shot_cache=None,
+                 seed=None, recorder=None, num_balls=1, brick_values=None):
+        if headless and state != GameState.AGENT_PLAYING:
+            raise ValueError('headless mode requires GameState.AGENT_PLAYING')
+        if num_balls > 1 and not event_driven:
+            raise ValueError('volleys of several balls require event_driven')
 
         # agent related attributes
-        self.actions = np.arange(math.pi/2.0 * -1 + 0.1, math.pi/2.0, 0.1)
+        self.actions = physics.ACTIONS
         self.number_of_actions = self.actions.shape[0]
 
-        # create screen
-        self.screen = pygame.display.set_mode(SCREEN_SIZE)
-        # screen title
-        pygame.display.set_caption("PLEASE WORK")
-
-        # max phase the environement has ever seen
-        self.max_phase = 0
-
-        # create clock
-        self.clock = pygame.time.Clock()
-
-        # this will be used to draw on the screen
-        self.font = pygame.font.Font(None, 30)
+        # headless mode runs without display, fonts and frame limiter, only
+        # every render_every-th episode is drawn (None means never)
+        self.headless = headless
+        self.render_every = render_every
+        self.screen = None
+        self.clock = None
+        self.font = None
+        self.sprites = None
+        if not headless:
+            self.init_display()
+
+        # agent shots that are not drawn can be solved analytically
+        # (see physics.solve_shot) instead of frame by frame
+        self.event_driven = event_driven
+
+        # every random decision of the environment comes from self.rng,
+        # brick_values maps the values of the bricks to their probabilities
+        # (see RowGenerator), shot_cache is used by event driven shots of
+        # num_balls == 1 and recorder (a trajectory.TrajectoryWriter)
+        # records every shot
+        self.core = GameCore(seed, brick_values, num_balls, shot_cache,
+                             recorder)
 
         # brick constants
         self.BRICK_WIDTH = BLOCK_SIZE
@@ -195,16 +263,47 @@ class Environment:
         self.init_game(ball_speed)
         
 
+    def init_display(self):
+        '''Initialize pygame, the screen, the clock and the font.'''
+        pygame.init()
+
+        # create screen
+        self.screen = pygame.display.set_mode(SCREEN_SIZE)
+        # screen title
+        pygame.display.set_caption("PLEASE WORK")
+
+        # create clock
+        self.clock = pygame.time.Clock()
+
+        # this will be used to draw on the screen
+        self.font = pygame.font.Font(None, 30)
+        self.sprites = SpriteCache(self.font)
+
+        if hasattr(self, 'ball'):
+            self.ball.screen = self.screen
+
+    def is_rendering(self):
+        '''True if the current episode should be drawn on the screen.'''
+        if not self.headless:
+            return True
+        if not self.render_every or self.episode % self.render_every:
+            return False
+        # the display is only created the first time it is needed
+        if self.screen is None:
+            self.init_display()
+        return True
+
     def init_game(self, ball_speed):
         '''Initialize main objects of the game accordingly with the game mode.'''
-        self.phase = 0
+        self.core.new_game()
         if self.state == GameState.HUMAN_PLAYING:
             self.state = GameState.MENU
             
         self.waiting_input = False
 
-        # stores the bricks values
-        self.bricks_matrix = np.zeros((NUM_BLOCKS_Y - 1, NUM_BLOCKS_X))
+        # pygame.Rect of each brick by cell, see create_bricks
+        self.bricks = {}
+        self.bricks_key = None
 
         # create display lines
         line_height = 10
@@ -225,64 +324,73 @@ class Environment:
         self.ball.x = SCREEN_SIZE[0]/2.0
         self.ball.y = self.bottom_line.top - 16
     
-    def step(self, state, action):
+    def step(self, state, action, row=None):
         '''Interaction with the agent.
             
             Args:
                 state (tensor): a tensor with the same shape as self.bricks_matrix.
                 action (angle): index of an action in self.actions (ball initial angle).
+                row (tensor): row created after the shot, a random one if None
+                    (used to replay recorded episodes).
             Returns:
-                next_state (tensor): a tensor with the same shaoe as self.bricks_matrix.
+                next_state (board): compact copy of self.bricks_matrix (see
+                    get_board).
                 r (int): reward. -1 if lost, 0 otherwhise.
         '''
         self.ball.set_angle(self.actions[action])
-        _, next_state, r = self.run()
-        if r == -1:
+        # the frame by frame simulation only knows a single ball, the other
+        # shots are solved by the core (see GameCore.shoot)
+        simulate = None
+        if not (self.event_driven and (self.num_balls > 1 or
+                                       not self.is_rendering())):
+            simulate = self.run
+        r, _ = self.core.step(action, row, simulate)
+
+        # the board after the shot if the game was lost, otherwise the
+        # board of the next phase (unkown behaviour from the environment)
+        next_state = self.get_board()
+        if r == LOSS_REWARD:
             self.init_game(self.ball_speed)
         else:
-            # unkown behaviour from the environment
-            self.next_phase()
-            next_state = copy.copy(self.bricks_matrix)   
+            self.waiting_input = True
+            self.set_ball_position()
+        if simulate is None and self.is_rendering():
+            self.show_board()
         return next_state, r
 
-    # ------------------ Create rows ------------------------
-    def random_row(self):
-        '''For now let's keep this as simple as we can.'''
-
-        # TODO:
-        # 0.6 of change of have some brick at each position of the row
-        # if there's a brick then: 0.25 of chance of having value V
-        # and 0.10 of chance of having value V * 2 and 0.05 of having V * 4
-        # obs: it can be full (no zeros) nor empty (only zeros)
+    def seed(self, seed):
+        '''Restarts the random rows from seed.'''
+        self.core.seed(seed)
 
-        # NOW: only bricks with v = 1
-        v = 1  # let's make this as simple as possible, v is constant
-        row = np.random.choice([v, 0],
-                               self.bricks_matrix.shape[1],
-                               p=[0.5, 0.5])
+    def attach_renderer(self, renderer):
+        '''Sends a snapshot of every shot to renderer (see renderer.py).'''
+        self.renderer = renderer
 
-        # if there are no zeros or is full of zeros then generate
-        # another row
-        zero_indexes = np.nonzero(row == 0)[0]
-        if zero_indexes.size == 0 or zero_indexes.size == row.size:
-            return self.random_row()
+    def detach_renderer(self):
+        '''Stops sending snapshots, returns the renderer (not closed).'''
+        renderer, self.renderer = self.renderer, None
+        return renderer
 
-        return row
-
-    def create_next_row(self):
-        '''Bricks are created randomly.'''
-
-        # generate a valid random row
-        r = self.random_row()
+    # ------------------ Create rows ------------------------
+    def random_row(self):
+        '''For now let's keep this as simple as we can.
 
-        # roll the matrix (this will move everything one row below
-        num_cols = self.bricks_matrix.shape[1]
-        self.bricks_matrix = np.roll(self.bricks_matrix, num_cols)
+           Rows can not be full nor empty, see RowGenerator (which can also
+           create bricks with different values).
+        '''
+        # NOW: only bricks with v = 1, each position with probability 0.5
+        return self.row_generator.next_row()
 
-        # add the row to the beginning
-        self.bricks_matrix[1] = r
+    def create_next_row(self, row=None):
+        '''Bricks are created randomly (unless row is given).'''
+        # move everything one row below and add the row to the beginning
+        self.core.insert_row(row)
 
     # ----------------- Bricks --------------------
+    def get_board(self):
+        '''Compact, hashable copy of self.bricks_matrix (see board.py).'''
+        return make_board(self.bricks_matrix)
+
     def brick_pos(self, r, c):
         '''Get a brick pos given its position at self.bricks_matrix.'''
         pos_x = c * BLOCK_SIZE
@@ -290,34 +398,30 @@ class Environment:
         return pos_x, pos_y
 
     def create_bricks(self):
-        '''Create bricks that can collide with the ball.''' 
-        self.bricks = []
+        '''Create bricks that can collide with the ball.
+
+           Bricks are indexed by their cell and are only rebuilt when
+           self.bricks_matrix changes.
+        ''' 
+        key = self.bricks_matrix.tostring()
+        if key == self.bricks_key:
+            return
+        self.bricks_key = key
+
+        self.bricks = {}
         row, col = np.nonzero(self.bricks_matrix != 0)
         for r, c in zip(row, col):
             pos_x, pos_y = self.brick_pos(r, c)
             brick = pygame.Rect(pos_x, pos_y,
                                 self.BRICK_WIDTH, self.BRICK_HEIGHT)
-            self.bricks.append((r, c, brick))
+            self.bricks[(r, c)] = brick
 
     # ----------------- Drawing ---------------------
     def draw_brick(self, r, c, border_size=10):
         v = int(self.bricks_matrix[r][c])
-        pos_x, pos_y = self.brick_pos(r, c)
-        rect = pygame.Rect(pos_x + border_size/2.0,
-                           pos_y + border_size/2.0,
-                           self.BRICK_WIDTH - border_size,
-                           self.BRICK_HEIGHT - border_size)
-        border = pygame.Rect(pos_x, pos_y,
-                             self.BRICK_WIDTH, self.BRICK_HEIGHT)
-        pygame.draw.rect(self.screen, WHITE, border)
-        pygame.draw.rect(self.screen, BRICK_COLOR[v], rect)
-
-        # negative_corr = 3 if v < 0 else 0
-        s = str(v)
-        size = self.font.size(s)
-        self.screen.blit(self.font.render(s, True, BLACK),
-                         ((pos_x + (BLOCK_SIZE - size[0])/2.0,
-                          (pos_y + (BLOCK_SIZE - size[1])/2.0))))
+        # the brick surface (border, color and value) is only rendered once
+        self.screen.blit(self.sprites.brick(v, border_size),
+                         self.brick_pos(r, c))
 
     def draw_bricks(self):
         row, col = np.nonzero(self.bricks_matrix != 0)
@@ -332,18 +436,31 @@ class Environment:
     def show_stats(self):
         if self.font:
             s = 'LEVEL: ' + str(self.phase) + ' BEST : ' + str(self.max_phase) 
-            size = self.font.size(s)
-            font_surface = self.font.render(s, False, WHITE)
-            self.screen.blit(font_surface, ((SCREEN_SIZE[0] - size[0])/2, 10))
+            font_surface = self.sprites.text(s)
+            self.screen.blit(font_surface,
+                             ((SCREEN_SIZE[0] - font_surface.get_width())/2,
+                              10))
 
     def show_message(self, message):
         if self.font:
-            size = self.font.size(message)
-            font_surface = self.font.render(message, False, WHITE)
-            x = (SCREEN_SIZE[0] - size[0]) / 2
-            y = (SCREEN_SIZE[1] - size[1]) / 2
+            font_surface = self.sprites.text(message)
+            x = (SCREEN_SIZE[0] - font_surface.get_width()) / 2
+            y = (SCREEN_SIZE[1] - font_surface.get_height()) / 2
             self.screen.blit(font_surface, (x, y))
 
+    def show_board(self):
+        '''Draws the current board once, for the shots that are not moved
+           frame by frame (volleys), so the window still shows the game and
+           handles its events.
+        '''
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                sys.exit()
+        self.clock.tick(50)
+        self.screen.fill(BLACK)
+        self.draw()
+        pygame.display.flip()
+
     def draw(self):
         # draw all bricks
         self.draw_bricks()
@@ -366,10 +483,17 @@ class Environment:
 
         self.ball.set_angle(math.atan2(dy, dx) + 0.5 * math.pi)
 
-    def next_phase(self):
+    def next_phase(self, row=None):
+        self.waiting_input = True
+        self.core.next_phase(row)
+        self.set_ball_position()
+
+    def prefill(self, depth):
+        '''Starts the game with depth rows of bricks (depth phases without
+           shooting), prefill(1) is the same as next_phase().
+        '''
         self.waiting_input = True
-        self.create_next_row()
-        self.phase += 1
+        self.core.prefill(depth)
         self.set_ball_position()
 
     def check_input(self, mouse_pos):
@@ -387,24 +511,21 @@ class Environment:
     def handle_collisions(self):
         floor_collision = self.ball.check_wall_collision()
 
-        for i, element in enumerate(self.bricks):
-            r, c, b = element
-            if self.ball.check_rect_collision(b):
+        # only bricks in the cells the ball overlaps can collide with it
+        for r, c in physics.cells_overlapping(self.ball.x, self.ball.y,
+                                              self.ball.size):
+            b = self.bricks.get((r, c))
+            if b is not None and self.ball.check_rect_collision(b):
                 # remove value from brick
                 # print self.bricks_matrix[r][c], r, c
                 if self.bricks_matrix[r][c] > 0:
                     self.bricks_matrix[r][c] -= 1
 
         if self.state == GameState.AGENT_PLAYING:
-            final_state = floor_collision and np.nonzero(self.bricks_matrix[-1])[0].size
-            res = floor_collision, copy.copy(self.bricks_matrix), -1 if final_state else 0 
-            if final_state: 
-                self.max_phase = max(self.phase, self.max_phase)            
-                self.init_game(self.ball_speed)
-            return res
+            return self.agent_outcome(floor_collision)
         else:            
             if floor_collision:
-                if np.nonzero(self.bricks_matrix[-1])[0].size:
+                if self.core.is_lost():
                     self.max_phase = max(self.phase, self.max_phase)
                     self.init_game(self.ball_speed)
                 else:
@@ -412,6 +533,17 @@ class Environment:
 
         return floor_collision
 
+    def agent_outcome(self, floor_collision):
+        '''Returns (floor_collision, board, reward) to the agent. board is a
+           compact copy of bricks_matrix (see get_board), it is only built
+           once the ball reaches the floor (None before). A lost game is
+           restarted by step.
+        '''
+        if not floor_collision:
+            return False, None, 0
+        lost = self.core.is_lost()
+        return True, self.get_board(), LOSS_REWARD if lost else 0
+
     def play(self):
         if not self.waiting_input:
             self.create_bricks()
@@ -426,6 +558,13 @@ class Environment:
 
     def run(self):
         while 1:
+            if not self.is_rendering():
+                # headless: no events, no frame limiter and no drawing
+                res = self.play_agent()
+                if res[0]:
+                    return res
+                continue
+
             # check for events
             mouse_pos = None
             for event in pygame.event.get():
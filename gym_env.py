@@ -0,0 +1,252 @@
+'''
+Copyright 2017 Marianne Linhares Monteiro, @mari-linhares at github.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import functools
+import multiprocessing
+
+# for vectors manipulation
+import numpy as np
+
+# gym is optional, the spaces below are used when it is not installed
+try:
+    import gym
+    from gym.spaces import Box, Discrete
+    Env = gym.Env
+except ImportError:
+    gym = None
+    Env = object
+
+# the renderer is imported only when render is called
+from core import GameCore, LOSS_REWARD, core_property
+import physics
+from seeding import make_rng, spawn_seeds
+
+if gym is None:
+    class Discrete():
+        '''Actions 0, ..., n - 1 (same interface as gym.spaces.Discrete).'''
+        def __init__(self, n):
+            self.n = n
+            self.shape = ()
+            self.dtype = np.int64
+            self.rng = make_rng()
+
+        def seed(self, seed=None):
+            self.rng.seed(seed)
+            return [seed]
+
+        def sample(self):
+            return self.rng.randint(self.n)
+
+        def contains(self, x):
+            return 0 <= int(x) < self.n
+
+    class Box():
+        '''Tensors with values in [low, high] (same as gym.spaces.Box).'''
+        def __init__(self, low, high, shape, dtype=np.float64):
+            self.low = np.full(shape, low, dtype=dtype)
+            self.high = np.full(shape, high, dtype=dtype)
+            self.shape = shape
+            self.dtype = dtype
+
+        def contains(self, x):
+            x = np.asarray(x)
+            return (x.shape == self.shape and np.all(x >= self.low) and
+                    np.all(x <= self.high))
+
+
+class BrickBlastEnv(Env):
+    '''Game with the usual reset() / step(action) interface.
+
+       A wrapper around core.GameCore, which has the rules Environment uses
+       when an agent is playing, without pygame: observations are the
+       bricks values, actions are indexes of physics.ACTIONS and the reward
+       is -1 when the game is lost.
+
+       Args:
+           num_balls (int): balls launched per shot.
+           brick_values (dict): value -> probability of the bricks values.
+           shot_cache (ShotCache): optional cache of single ball shots.
+           recorder (TrajectoryWriter): optional, records every shot.
+           curriculum (Curriculum): optional, chooses how many rows of
+               bricks each game starts with (see curriculum.py).
+    '''
+    metadata = {'render.modes': ['human']}
+
+    bricks_matrix = core_property('bricks_matrix')
+    phase = core_property('phase')
+    max_phase = core_property('max_phase')
+    renderer = core_property('renderer')
+
+    def __init__(self, seed=None, num_balls=1, brick_values=None,
+                 shot_cache=None, recorder=None, curriculum=None):
+        self.core = GameCore(seed, brick_values, num_balls, shot_cache,
+                             recorder)
+        self.actions = self.core.actions
+        self.curriculum = curriculum
+
+        max_value = max(brick_values) if brick_values else 1
+        self.action_space = Discrete(self.actions.shape[0])
+        self.observation_space = Box(0, max_value,
+                                     (physics.NUM_ROWS, physics.NUM_COLS),
+                                     dtype=np.float64)
+        self.done = True
+
+    def seed(self, seed=None):
+        self.core.seed(seed)
+        return [seed]
+
+    def reset(self):
+        self.core.new_game()
+        self.core.prefill(self.curriculum.sample() if self.curriculum else 1)
+        self.done = False
+        return self.bricks_matrix.copy()
+
+    def step(self, action):
+        '''Shoots with angle self.actions[action].
+
+            Returns:
+                observation (tensor): bricks values.
+                reward (int): -1 if the game was lost, 0 otherwise.
+                done (bool): True if the game was lost.
+                info (dict): phase (number of phases played) and hits
+                    (number of bricks hit by the shot).
+        '''
+        if self.done:
+            raise RuntimeError('the game is over, call reset()')
+
+        reward, hits = self.core.step(action)
+        self.done = reward == LOSS_REWARD
+        info = {'phase': self.phase, 'hits': hits}
+        return self.bricks_matrix.copy(), reward, self.done, info
+
+    def render(self, mode='human'):
+        '''Opens a live view in another process (see renderer.py).'''
+        if self.renderer is None:
+            from renderer import Renderer
+            self.renderer = Renderer().start()
+
+    def close(self):
+        if self.renderer is not None:
+            self.renderer.close()
+            self.renderer = None
+
+
+# ------- Vectorized environments ----------
+def worker(remote, parent_remote, env_fn):
+    '''Runs an environment in a subprocess, commands come from remote.'''
+    parent_remote.close()
+    env = env_fn()
+    try:
+        while True:
+            command, data = remote.recv()
+            if command == 'step':
+                observation, reward, done, info = env.step(data)
+                if done:
+                    # restarted here, so the trainer never waits for it
+                    info['terminal_observation'] = observation
+                    observation = env.reset()
+                remote.send((observation, reward, done, info))
+            elif command == 'reset':
+                remote.send(env.reset())
+            elif command == 'seed':
+                remote.send(env.seed(data))
+            elif command == 'close':
+                break
+    finally:
+        env.close()
+        remote.close()
+
+
+class SubprocVectorEnv():
+    '''Steps N environments at the same time, each in its own process.
+
+       step_async sends the actions and returns immediately, step_wait
+       collects the results, so the trainer can work while the games are
+       being simulated. Games that are lost are restarted automatically,
+       their last observation is in info['terminal_observation'].
+
+       Args:
+           env_fns (list): functions that create each environment, for
+               example [functools.partial(BrickBlastEnv, seed=s), ...].
+    '''
+    def __init__(self, env_fns):
+        self.num_envs = len(env_fns)
+        self.remotes, work_remotes = zip(*[multiprocessing.Pipe()
+                                           for _ in env_fns])
+        self.processes = []
+        for work_remote, remote, env_fn in zip(work_remotes, self.remotes,
+                                               env_fns):
+            process = multiprocessing.Process(
+                target=worker, args=(work_remote, remote, env_fn))
+            process.daemon = True
+            process.start()
+            work_remote.close()
+            self.processes.append(process)
+
+        probe = env_fns[0]()
+        self.action_space = probe.action_space
+        self.observation_space = probe.observation_space
+        probe.close()
+
+        self.waiting = False
+        self.closed = False
+
+    @classmethod
+    def from_seed(cls, num_envs, seed=None, **env_kwargs):
+        '''num_envs BrickBlastEnv with independent streams of seed.'''
+        seeds = [None] * num_envs
+        if seed is not None:
+            seeds = spawn_seeds(seed, num_envs)
+        return cls([functools.partial(BrickBlastEnv, seed=s, **env_kwargs)
+                    for s in seeds])
+
+    def reset(self):
+        for remote in self.remotes:
+            remote.send(('reset', None))
+        return np.stack([remote.recv() for remote in self.remotes])
+
+    def seed(self, seed):
+        for remote, s in zip(self.remotes, spawn_seeds(seed, self.num_envs)):
+            remote.send(('seed', s))
+        return [remote.recv() for remote in self.remotes]
+
+    def step_async(self, actions):
+        for remote, action in zip(self.remotes, actions):
+            remote.send(('step', int(action)))
+        self.waiting = True
+
+    def step_wait(self):
+        '''Returns (observations, rewards, dones, infos) of every game.'''
+        results = [remote.recv() for remote in self.remotes]
+        self.waiting = False
+        observations, rewards, dones, infos = zip(*results)
+        return (np.stack(observations), np.array(rewards), np.array(dones),
+                list(infos))
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            self.step_wait()
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for process in self.processes:
+            process.join()
+        self.closed = True
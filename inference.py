@@ -0,0 +1,53 @@
+'''
+Copyright 2017 Marianne Linhares Monteiro, @mari-linhares at github.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# for vectors manipulation
+import numpy as np
+
+import physics
+
+THETA_OUTPUT = 'pretrained_agent.npy'
+
+
+def load_theta(path=THETA_OUTPUT, mmap=False):
+    '''Loads theta saved with np.save.
+
+       With mmap the file is memory mapped read-only: nothing is copied at
+       startup and processes reading the same file share its pages.
+    '''
+    return np.load(path, mmap_mode='r' if mmap else None)
+
+
+class GreedyPolicy():
+    '''Inference only version of LinearFunctionSarsaAgent.
+
+       Always chooses the best action and never imports pygame, so
+       evaluation processes start fast and stay small.
+    '''
+    def __init__(self, theta=None, path=THETA_OUTPUT, mmap=True):
+        if theta is None:
+            theta = load_theta(path, mmap)
+
+        self.actions = physics.ACTIONS
+        self.number_of_actions = self.actions.shape[0]
+        # (bricks, actions) view of theta, same layout as the Sarsa agent
+        self.theta_matrix = theta.reshape(-1, self.number_of_actions)
+
+    def try_all_actions(self, s):
+        return np.ravel(s).dot(self.theta_matrix)
+
+    def choose_best_action(self, s):
+        return int(np.argmax(self.try_all_actions(s)))
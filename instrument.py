@@ -0,0 +1,168 @@
+'''
+Copyright 2017 Marianne Linhares Monteiro, @mari-linhares at github.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import cProfile
+import functools
+import os
+import resource
+import sys
+import time
+
+# allocations are traced by tracemalloc where it exists (python 3),
+# otherwise the growth of the peak memory of the process is measured
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# the memory column says which of the two it holds
+MEMORY_COLUMN = 'bytes' if tracemalloc is not None else 'peak_rss_growth'
+
+# hot paths instrumented by Instrumentation.attach (the q of the current
+# step is computed inside run_episode, active_features counts it)
+ENVIRONMENT_METHODS = ['run', 'handle_collisions', 'create_bricks']
+# methods of the core.GameCore of the environment (event driven shots)
+CORE_METHODS = ['shoot']
+AGENT_METHODS = ['get_q', 'phi', 'active_features', 'try_all_actions',
+                 'update_theta', 'replay_update', 'batch_update',
+                 'policy_batch']
+
+PROFILE_COLUMNS = ['episode', 'function', 'calls', 'seconds', MEMORY_COLUMN]
+# name of the row with the totals of each episode
+EPISODE_ROW = 'episode'
+
+# ru_maxrss is in kilobytes, except on OS X
+MAXRSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+
+def allocated_bytes():
+    '''Bytes traced by tracemalloc if it is tracing, otherwise the peak
+       resident memory of the process.
+    '''
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * MAXRSS_UNIT
+
+
+class Instrumentation():
+    '''Opt-in call counts, cumulative time and allocations per function.
+
+       Methods are only wrapped (on the instances, not on the classes) when
+       attach is called, so a run that is not instrumented executes exactly
+       the original code and pays nothing.
+
+       With track_allocations the bytes allocated by each function (or, on
+       python 2, how much it made the peak memory of the process grow, a
+       function that stays below the previous peak counts 0, see
+       MEMORY_COLUMN) are recorded, and every dump also writes the totals
+       of the episode.
+    '''
+    def __init__(self, track_allocations=False):
+        self.track_allocations = track_allocations
+        if (track_allocations and tracemalloc is not None and
+                not tracemalloc.is_tracing()):
+            tracemalloc.start()
+
+        # name -> [calls, seconds, bytes]
+        self.stats = {}
+        self.profiler = None
+
+        # start of the current episode, see dump
+        self.episode_start = time.time()
+        self.episode_memory = allocated_bytes() if track_allocations else 0
+
+    def wrap(self, obj, method_name, name=None):
+        '''Replaces obj.method_name by a version that records its cost.'''
+        name = name or '%s.%s' % (obj.__class__.__name__, method_name)
+        method = getattr(obj, method_name)
+        stats = self.stats.setdefault(name, [0, 0.0, 0])
+        track_allocations = self.track_allocations
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            if track_allocations:
+                memory = allocated_bytes()
+            start = time.time()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                stats[1] += time.time() - start
+                stats[0] += 1
+                if track_allocations:
+                    stats[2] += allocated_bytes() - memory
+
+        setattr(obj, method_name, wrapper)
+
+    def attach(self, environment=None, agent=None):
+        '''Instruments the hot paths of an Environment and/or an agent.'''
+        if environment is not None:
+            for method_name in ENVIRONMENT_METHODS:
+                self.wrap(environment, method_name)
+            for method_name in CORE_METHODS:
+                self.wrap(environment.core, method_name)
+        if agent is not None:
+            for method_name in AGENT_METHODS:
+                self.wrap(agent, method_name)
+
+    def reset(self):
+        for stats in self.stats.values():
+            stats[:] = [0, 0.0, 0]
+
+    def report(self):
+        '''Stats as text, the most expensive functions first.'''
+        lines = ['%-45s %10s %12s %16s' % ('function', 'calls', 'seconds',
+                                           MEMORY_COLUMN)]
+        for name, (calls, seconds, allocated) in sorted(
+                self.stats.items(), key=lambda item: -item[1][1]):
+            lines.append('%-45s %10d %12.4f %16d' % (name, calls, seconds,
+                                                     allocated))
+        return '\n'.join(lines)
+
+    def dump(self, path, episode):
+        '''Appends one row per function to a CSV file and resets the stats.
+
+           With track_allocations a row named EPISODE_ROW is also written,
+           with the time and the bytes allocated since the previous dump.
+        '''
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        with open(path, 'a') as f:
+            if new_file:
+                f.write(', '.join(PROFILE_COLUMNS) + '\n')
+            for name in sorted(self.stats):
+                calls, seconds, allocated = self.stats[name]
+                f.write('%d, %s, %d, %.6f, %d\n' % (episode, name, calls,
+                                                    seconds, allocated))
+            if self.track_allocations:
+                memory = allocated_bytes()
+                f.write('%d, %s, %d, %.6f, %d\n' % (
+                    episode, EPISODE_ROW, 1, time.time() - self.episode_start,
+                    memory - self.episode_memory))
+                self.episode_memory = memory
+        self.episode_start = time.time()
+        self.reset()
+
+    # ----------------- cProfile ---------------------
+    def start_profile(self):
+        '''Starts a cProfile session (independent of the wrappers).'''
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def dump_profile(self, path):
+        '''Writes the cProfile stats collected so far, see pstats.'''
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(path)
+            self.profiler.enable()
@@ -0,0 +1,180 @@
+'''
+Copyright 2017 Marianne Linhares Monteiro, @mari-linhares at github.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import argparse
+import logging
+import multiprocessing
+import time
+
+# for vectors manipulation
+import numpy as np
+
+from agent import LinearFunctionSarsaAgent, LEVEL_OUTPUT, THETA_OUTPUT
+from checkpoint import CheckpointManager
+from game import Environment, GameState
+import physics
+from seeding import spawn_seeds
+from training_log import TrainingLog, configure_logging
+
+logger = logging.getLogger(__name__)
+
+# agent of the current worker process, created by init_worker
+worker_agent = None
+
+
+class RolloutAgent(LinearFunctionSarsaAgent):
+    '''Sarsa agent used by the workers.
+
+       It reads theta from the buffer shared with the learner and accumulates
+       its updates in self.updates instead of changing theta.
+    '''
+    def __init__(self, environment, theta, **kwargs):
+        LinearFunctionSarsaAgent.__init__(self, environment, theta=theta,
+                                          **kwargs)
+        self.updates = np.zeros_like(theta)
+
+    def update_theta(self, step):
+        self.E.apply(self.updates, step)
+
+
+def init_worker(buffer, agent_kwargs, env_kwargs):
+    '''Creates the environment and the agent of a worker process.'''
+    global worker_agent
+    # no copy: the worker always sees the learner's latest theta
+    theta = np.frombuffer(buffer)
+    env = Environment(state=GameState.AGENT_PLAYING, headless=True,
+                      **env_kwargs)
+    worker_agent = RolloutAgent(env, theta, **agent_kwargs)
+
+
+def run_rollout(seed):
+    '''Plays one episode, returns the accumulated updates, its length and
+       its reward. With a seed the episode does not depend on the worker
+       that plays it.
+    '''
+    if seed is not None:
+        worker_agent.seed(seed)
+    worker_agent.updates[:] = 0
+    phase, reward = worker_agent.run_episode()
+    return worker_agent.updates, phase, reward
+
+
+class ParallelTrainer():
+    '''Trains a LinearFunctionSarsaAgent with a pool of rollout workers.
+
+       theta lives in shared memory, workers play episodes against it and
+       send back their accumulated updates, which only the learner applies.
+       Shots are event driven unless ball_speed is given, then the workers
+       simulate them frame by frame at that speed (as agent.py does without
+       --event-driven).
+    '''
+    def __init__(self, num_workers=None, discount_factor=0.2, _lambda=1,
+                 seed=None, ball_speed=None):
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        # stream 0 of seed initializes theta, stream e + 1 plays episode e
+        self.seed = seed
+
+        env_kwargs = {'event_driven': True}
+        if ball_speed is not None:
+            env_kwargs = {'event_driven': False, 'ball_speed': ball_speed}
+
+        # the learner agent is only used to initialize theta and to save it
+        env = Environment(state=GameState.AGENT_PLAYING, headless=True,
+                          **env_kwargs)
+        agent_seed = spawn_seeds(seed, 1)[0] if seed is not None else None
+        agent = LinearFunctionSarsaAgent(env, discount_factor, _lambda,
+                                         seed=agent_seed)
+        self.epsilon = agent.get_e(None)
+
+        self.buffer = multiprocessing.RawArray('d', agent.number_of_parameters)
+        self.theta = np.frombuffer(self.buffer)
+        self.theta[:] = agent.theta
+
+        agent_kwargs = {'discount_factor': discount_factor,
+                        '_lambda': _lambda}
+        self.pool = multiprocessing.Pool(self.num_workers,
+                                         initializer=init_worker,
+                                         initargs=(self.buffer, agent_kwargs,
+                                                   env_kwargs))
+
+    def train(self, episodes=None, episodes_per_round=None):
+        '''Trains for a number of episodes (forever if None).
+
+           Episodes are submitted in rounds so the pool never queues more
+           than episodes_per_round of them.
+        '''
+        episodes_per_round = episodes_per_round or 4 * self.num_workers
+        e = 0
+        start = time.time()
+        with CheckpointManager(theta_output=THETA_OUTPUT) as checkpoints, \
+                TrainingLog(LEVEL_OUTPUT) as training_log:
+            while episodes is None or e < episodes:
+                n = episodes_per_round
+                if episodes is not None:
+                    n = min(n, episodes - e)
+
+                seeds = [None] * n
+                if self.seed is not None:
+                    seeds = spawn_seeds(self.seed, n, start=e + 1)
+
+                for updates, phase, reward in self.pool.imap_unordered(
+                        run_rollout, seeds):
+                    self.theta += updates
+
+                    training_log.log(e, phase, reward, self.epsilon,
+                                     time.time() - start)
+                    e += 1
+
+                    if e % 10 == 0:
+                        checkpoints.save(e, self.theta)
+                        logger.info('Episode: %d', e)
+
+            if e % 10:
+                # not saved by the last round yet
+                checkpoints.save(e, self.theta)
+        return self.theta
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Train the Sarsa agent with parallel rollout workers.')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default: all cores)')
+    parser.add_argument('--episodes', type=int, default=None,
+                        help='number of episodes (default: train forever)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seeds theta and the episodes')
+    parser.add_argument('--frames', action='store_true',
+                        help='simulate the shots frame by frame, like '
+                             'agent.py without --event-driven (slower)')
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help='-v shows progress, -vv every step')
+    args = parser.parse_args()
+    configure_logging(args.verbose)
+
+    trainer = ParallelTrainer(num_workers=args.workers, seed=args.seed,
+                              ball_speed=physics.BALL_SPEED if args.frames else None)
+    try:
+        trainer.train(args.episodes)
+    finally:
+        trainer.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,471 @@
+'''
+Copyright 2017 Marianne Linhares Monteiro, @mari-linhares at github.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# -------- Imports ------------
+import math
+
+import numpy as np
+
+# --------- Constants ---------
+# screen
+BLOCK_SIZE = 64
+NUM_BLOCKS_Y = 10
+NUM_BLOCKS_X = 7
+SCREEN_SIZE = BLOCK_SIZE * NUM_BLOCKS_X, BLOCK_SIZE * NUM_BLOCKS_Y + 100
+
+# ball and field limits (the same values the pygame Environment uses)
+BALL_SIZE = 8
+LINE_HEIGHT = 10
+TOP_LIMIT = BLOCK_SIZE
+FLOOR_LIMIT = SCREEN_SIZE[1] - BLOCK_SIZE + LINE_HEIGHT
+BALL_START = SCREEN_SIZE[0]/2.0, FLOOR_LIMIT - 16
+# pixels per frame of the frame by frame shots agent.py trains with
+BALL_SPEED = 15
+
+# bricks_matrix shape
+NUM_ROWS = NUM_BLOCKS_Y - 1
+NUM_COLS = NUM_BLOCKS_X
+
+# edges of every cell of bricks_matrix
+CELL_LEFT = np.tile(np.arange(NUM_COLS) * float(BLOCK_SIZE), (NUM_ROWS, 1))
+CELL_RIGHT = CELL_LEFT + BLOCK_SIZE
+CELL_TOP = np.tile((np.arange(NUM_ROWS) * float(BLOCK_SIZE) +
+                    BLOCK_SIZE)[:, np.newaxis], (1, NUM_COLS))
+CELL_BOTTOM = CELL_TOP + BLOCK_SIZE
+
+# ball initial angles an agent can choose from
+ACTIONS = np.arange(math.pi/2.0 * -1 + 0.1, math.pi/2.0, 0.1)
+
+# events closer than this are considered simultaneous
+EPSILON = 1e-9
+# a shot always reaches the floor, this only protects against bad input
+MAX_EVENTS = 10000
+
+
+# ------- Functions ----------
+def direction(angle):
+    '''Unit velocity of a ball launched with angle (same as Ball.move).'''
+    return math.sin(angle), -math.cos(angle)
+
+
+def cells_overlapping(x, y, size=BALL_SIZE):
+    '''Cells of bricks_matrix touched by the ball bounding box.
+
+       Borders are inclusive (like Ball.check_rect_collision), the cells
+       are returned in row major order and are always inside the grid.
+    '''
+    r_lo = max(int(math.ceil((y - size) / BLOCK_SIZE)) - 2, 0)
+    r_hi = min(int(math.floor((y + size) / BLOCK_SIZE)) - 1, NUM_ROWS - 1)
+    c_lo = max(int(math.ceil((x - size) / BLOCK_SIZE)) - 1, 0)
+    c_hi = min(int(math.floor((x + size) / BLOCK_SIZE)), NUM_COLS - 1)
+    return [(r, c) for r in range(r_lo, r_hi + 1)
+            for c in range(c_lo, c_hi + 1)]
+
+
+def slab_times(p, d, lo, hi):
+    '''Entry and exit times of the point p + t * d in the slab [lo, hi].
+
+       All arguments are broadcasted, a still point (d == 0) is inside the
+       slab forever or never.
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t1 = (lo - p) / d
+        t2 = (hi - p) / d
+    near = np.minimum(t1, t2)
+    far = np.maximum(t1, t2)
+
+    still = np.equal(d, 0)
+    if np.any(still):
+        inside = (lo <= p) & (p <= hi)
+        near = np.where(still, np.where(inside, -np.inf, np.inf), near)
+        far = np.where(still, np.where(inside, np.inf, -np.inf), far)
+    return near, far
+
+
+def brick_impacts(x, y, dx, dy, bricks, size=BALL_SIZE):
+    '''Time of impact between the ball and every brick (ray vs AABB).
+
+       Each brick is expanded by the ball radius, so the ball center is
+       a ray. Arguments broadcast against the bricks grid, so x, y, dx and
+       dy can be scalars or (N, 1, 1) arrays for N balls.
+
+       Returns:
+           times (tensor): time of impact, inf if the brick is not hit.
+    '''
+    near_x, far_x = slab_times(x, dx, CELL_LEFT - size, CELL_RIGHT + size)
+    near_y, far_y = slab_times(y, dy, CELL_TOP - size, CELL_BOTTOM + size)
+
+    entry = np.maximum(near_x, near_y)
+    leave = np.minimum(far_x, far_y)
+    hit = (bricks > 0) & (entry <= leave) & (entry > EPSILON)
+
+    return np.where(hit, entry, np.inf)
+
+
+def touching(x, y, dx, dy, bricks, size=BALL_SIZE):
+    '''Bricks a ball collides with where it is, as Ball.check_rect_collision
+       decides it: the ball overlaps one of the faces of the brick and moves
+       towards it (touching the face is not enough).
+
+       Broadcasts like brick_impacts.
+    '''
+    x_overlap = ((x + size > CELL_LEFT + EPSILON) &
+                 (x - size < CELL_RIGHT - EPSILON))
+    y_overlap = ((y + size > CELL_TOP + EPSILON) &
+                 (y - size < CELL_BOTTOM - EPSILON))
+    y_face = np.where(dy < 0, np.abs(y - CELL_BOTTOM) <= size,
+                      (dy > 0) & (np.abs(y - CELL_TOP) <= size))
+    x_face = np.where(dx > 0, np.abs(x - CELL_LEFT) <= size,
+                      (dx < 0) & (np.abs(x - CELL_RIGHT) <= size))
+    return (bricks > 0) & ((x_overlap & y_face) | (y_overlap & x_face))
+
+
+def bounce(cells, x, y, dx, dy, size=BALL_SIZE):
+    '''Bounces a ball on the brick it just hit (cells are flat indexes of
+       bricks_matrix), the same way as Ball.check_rect_collision.
+
+       A ball going up (down) whose center is within size of the bottom
+       (top) of the brick bounces vertically, even if it touched a side of
+       the brick first, otherwise it bounces horizontally. Like the frame by
+       frame simulation, the ball is mirrored out of the brick, so it only
+       moves when it hit near a corner.
+
+       Works with scalars and with arrays of balls.
+
+       Returns:
+           x, y, dx, dy (float or tensor): position and velocity after the
+               bounce.
+    '''
+    rows, cols = np.divmod(cells, NUM_COLS)
+    top = (rows + 1) * float(BLOCK_SIZE)
+    bottom = top + BLOCK_SIZE
+    left = cols * float(BLOCK_SIZE)
+    right = left + BLOCK_SIZE
+
+    going_up = dy < 0
+    flip_y = np.where(going_up, y >= bottom - size - EPSILON,
+                      y <= top + size + EPSILON)
+    y = np.where(flip_y, np.where(going_up, 2 * (bottom + size) - y,
+                                  2 * (top - size) - y), y)
+    x = np.where(flip_y, x, np.where(dx > 0, 2 * (left - size) - x,
+                                     2 * (right + size) - x))
+    return x, y, np.where(flip_y, dx, -dx), np.where(flip_y, -dy, dy)
+
+
+def wall_impacts(x, y, dx, dy, size=BALL_SIZE):
+    '''Time of impact against the side walls, the top line and the floor.'''
+    width = SCREEN_SIZE[0]
+
+    if dx > 0:
+        t_side = (width - size - x) / dx
+    elif dx < 0:
+        t_side = (size - x) / dx
+    else:
+        t_side = float('inf')
+
+    t_top = t_floor = float('inf')
+    if dy < 0:
+        t_top = (TOP_LIMIT + size - y) / dy
+    elif dy > 0:
+        t_floor = (FLOOR_LIMIT - size - y) / dy
+
+    return t_side, t_top, t_floor
+
+
+def wall_impacts_batch(x, y, dx, dy, size=BALL_SIZE):
+    '''Same as wall_impacts for arrays of balls.'''
+    width = SCREEN_SIZE[0]
+    inf = np.inf
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_side = np.where(dx > 0, (width - size - x) / dx,
+                          np.where(dx < 0, (size - x) / dx, inf))
+        t_top = np.where(dy < 0, (TOP_LIMIT + size - y) / dy, inf)
+        t_floor = np.where(dy > 0, (FLOOR_LIMIT - size - y) / dy, inf)
+    return t_side, t_top, t_floor
+
+
+def solve_shot(bricks_matrix, x, y, angle, size=BALL_SIZE,
+               max_events=MAX_EVENTS, path=None):
+    '''Simulates a shot jumping from one collision to the next one.
+
+       Instead of moving the ball a fixed distance per frame, the next time
+       of impact against the walls and the bricks is computed analytically,
+       so the result does not depend on the ball speed and no collision is
+       ever missed.
+
+       Bricks are hit as by the frame by frame simulation: a ball touching
+       several bricks at once (a seam or a corner between them) only hits
+       the first one in row major order and bounces on it as described by
+       bounce. When the bounce moves the ball onto other bricks (see
+       touching) they are hit right away, as in the same frame. The frame
+       by frame simulation still differs on a few shots because it only
+       checks collisions once per frame, the faster the ball the more (see
+       benchmark.check_shots).
+
+       Args:
+           bricks_matrix (tensor): bricks values, it is not modified.
+           x, y (float): initial ball position.
+           angle (float): initial ball angle (same convention as Ball).
+           path (list): if given, the initial position and the position of
+               every collision are appended to it (for drawing the shot).
+       Returns:
+           floor_x (float): x position where the ball hit the floor.
+           bricks_matrix (tensor): bricks values after the shot.
+           hits (int): number of times the ball hit a brick.
+    '''
+    bricks = np.array(bricks_matrix, copy=True)
+    dx, dy = direction(angle)
+    hits = 0
+    if path is not None:
+        path.append((x, y))
+
+    for _ in xrange(max_events):
+        times = brick_impacts(x, y, dx, dy, bricks, size)
+        t_brick = times.min()
+        t_side, t_top, t_floor = wall_impacts(x, y, dx, dy, size)
+
+        t = min(t_brick, t_side, t_top, t_floor)
+        x += dx * t
+        y += dy * t
+
+        if t_floor <= t + EPSILON:
+            if path is not None:
+                path.append((x, y))
+            return x, bricks, hits
+
+        # walls first, like Ball.check_wall_collision
+        if t_side <= t + EPSILON:
+            dx = -dx
+        if t_top <= t + EPSILON:
+            dy = -dy
+        if t_brick <= t + EPSILON:
+            cells = times <= t + EPSILON
+            while cells.any():
+                # the first brick in row major order
+                cell = np.argmax(cells)
+                bricks.flat[cell] -= 1
+                hits += 1
+                x, y, dx, dy = [float(v) for v in
+                                bounce(cell, x, y, dx, dy, size)]
+                cells = touching(x, y, dx, dy, bricks, size)
+        if path is not None:
+            path.append((x, y))
+
+    raise RuntimeError('ball did not reach the floor after %d events'
+                       % max_events)
+
+
+def solve_shots(bricks_matrices, x, y, angles, size=BALL_SIZE,
+                max_events=MAX_EVENTS):
+    '''Vectorized solve_shot: one ball on each of N boards.
+
+       Every iteration moves all balls still flying to their next collision,
+       balls that reach the floor stop being simulated.
+
+       Args:
+           bricks_matrices (tensor): (N, rows, cols) bricks values, it is
+               not modified.
+           x, y (float or tensor): initial balls positions.
+           angles (tensor): (N,) initial balls angles.
+       Returns:
+           floor_x (tensor): (N,) x positions where the balls hit the floor.
+           bricks_matrices (tensor): bricks values after the shots.
+           hits (tensor): (N,) number of bricks hit by each ball.
+    '''
+    bricks = np.array(bricks_matrices, copy=True)
+    angles = np.asarray(angles, dtype=float)
+    n = bricks.shape[0]
+
+    x = np.array(np.broadcast_to(x, (n,)), dtype=float)
+    y = np.array(np.broadcast_to(y, (n,)), dtype=float)
+    dx = np.sin(angles)
+    dy = -np.cos(angles)
+    hits = np.zeros(n, dtype=int)
+    flying = np.arange(n)
+
+    for _ in xrange(max_events):
+        if flying.size == 0:
+            return x, bricks, hits
+
+        fx, fy, fdx, fdy = x[flying], y[flying], dx[flying], dy[flying]
+        grid = (slice(None), np.newaxis, np.newaxis)
+        times = brick_impacts(fx[grid], fy[grid], fdx[grid], fdy[grid],
+                              bricks[flying], size)
+        times = times.reshape(flying.size, -1)
+        t_brick = times.min(axis=1)
+        t_side, t_top, t_floor = wall_impacts_batch(fx, fy, fdx, fdy, size)
+
+        t = np.minimum(np.minimum(t_brick, t_side), np.minimum(t_top, t_floor))
+        x[flying] = fx + fdx * t
+        y[flying] = fy + fdy * t
+
+        # walls first, then the bricks as in solve_shot
+        limit = t + EPSILON
+        dx[flying] = np.where(t_side <= limit, -fdx, fdx)
+        dy[flying] = np.where(t_top <= limit, -fdy, fdy)
+
+        struck = (t_brick <= limit) & (t_floor > limit)
+        balls = flying[struck]
+        cells = times[struck] <= limit[struck, np.newaxis]
+        while balls.size:
+            first = np.argmax(cells, axis=1)
+            bricks.reshape(n, -1)[balls, first] -= 1
+            hits[balls] += 1
+            x[balls], y[balls], dx[balls], dy[balls] = bounce(
+                first, x[balls], y[balls], dx[balls], dy[balls], size)
+            cells = touching(x[balls][grid], y[balls][grid], dx[balls][grid],
+                             dy[balls][grid], bricks[balls], size)
+            cells = cells.reshape(balls.size, -1)
+            more = cells.any(axis=1)
+            balls, cells = balls[more], cells[more]
+
+        flying = flying[t_floor > limit]
+
+    raise RuntimeError('balls did not reach the floor after %d events'
+                       % max_events)
+
+
+def solve_volley(bricks_matrix, x, y, angle, num_balls, spacing=4 * BALL_SIZE,
+                 size=BALL_SIZE, max_events=MAX_EVENTS):
+    '''Simulates a volley of num_balls balls launched with the same angle,
+       one every spacing pixels of flight, that share the same bricks.
+
+       The next collision of every ball (its time and what it hits) is
+       computed once, when the ball is launched or bounces, and kept until
+       it happens. So each event only simulates again the balls involved:
+       the ones that collided and the ones that were flying towards a brick
+       that was just destroyed.
+
+       Args:
+           bricks_matrix (tensor): bricks values, it is not modified.
+           x, y (float): position the balls are launched from.
+           angle (float): initial angle of all balls.
+           num_balls (int): number of balls.
+       Returns:
+           floor_x (tensor): (num_balls,) x positions where the balls hit
+               the floor.
+           bricks_matrix (tensor): bricks values after the volley.
+           hits (tensor): (num_balls,) number of bricks hit by each ball.
+    '''
+    bricks = np.array(bricks_matrix, copy=True)
+    # flat view, brick_impacts results are flattened the same way
+    flat_bricks = bricks.reshape(-1)
+    start_dx, start_dy = direction(angle)
+    grid = (slice(None), np.newaxis, np.newaxis)
+
+    # position and velocity of every ball at time t0 (launch or last event)
+    x0 = np.full(num_balls, x, dtype=float)
+    y0 = np.full(num_balls, y, dtype=float)
+    dx = np.full(num_balls, start_dx)
+    dy = np.full(num_balls, start_dy)
+    t0 = np.arange(num_balls) * float(spacing)
+
+    # next event of every ball: its time (also relative to t0, which is
+    # more precise), the brick it hits (-1 if none, also as a mask) and the
+    # walls it bounces on
+    t_next = np.empty(num_balls)
+    dt_next = np.empty(num_balls)
+    cell_next = np.full(num_balls, -1)
+    hit_next = np.zeros((num_balls, flat_bricks.size), dtype=bool)
+    flip_x_next = np.zeros(num_balls, dtype=bool)
+    flip_y_next = np.zeros(num_balls, dtype=bool)
+    floor_next = np.zeros(num_balls, dtype=bool)
+
+    floor_x = np.zeros(num_balls)
+    hits = np.zeros(num_balls, dtype=int)
+    flying = np.ones(num_balls, dtype=bool)
+
+    def schedule(balls):
+        times = brick_impacts(x0[balls][grid], y0[balls][grid],
+                              dx[balls][grid], dy[balls][grid], bricks, size)
+        times = times.reshape(balls.size, -1)
+        t_brick = times.min(axis=1)
+        t_side, t_top, t_floor = wall_impacts_batch(x0[balls], y0[balls],
+                                                    dx[balls], dy[balls],
+                                                    size)
+        t = np.minimum(np.minimum(t_brick, t_side), np.minimum(t_top, t_floor))
+        limit = t + EPSILON
+
+        # only the first brick hit in row major order (see solve_shot)
+        brick = (t_brick <= limit) & (t_floor > limit)
+        cells = np.argmax(times <= limit[:, np.newaxis], axis=1)
+        cell_next[balls] = np.where(brick, cells, -1)
+        hit_next[balls] = False
+        hit_next[balls[brick], cells[brick]] = True
+
+        dt_next[balls] = t
+        t_next[balls] = t0[balls] + t
+        flip_x_next[balls] = t_side <= limit
+        flip_y_next[balls] = t_top <= limit
+        floor_next[balls] = t_floor <= limit
+
+    schedule(np.arange(num_balls))
+    for _ in xrange(max_events * num_balls):
+        if not flying.any():
+            return floor_x, bricks, hits
+
+        t = t_next[flying].min()
+        balls = np.flatnonzero(flying & (t_next <= t + EPSILON))
+
+        # move the colliding balls to the collision
+        x0[balls] += dx[balls] * dt_next[balls]
+        y0[balls] += dy[balls] * dt_next[balls]
+        t0[balls] = t
+
+        # walls first, then the bricks as in solve_shot
+        dx[balls] = np.where(flip_x_next[balls], -dx[balls], dx[balls])
+        dy[balls] = np.where(flip_y_next[balls], -dy[balls], dy[balls])
+
+        alive = flat_bricks > 0
+        struck = balls[cell_next[balls] >= 0]
+        cells = cell_next[struck]
+        while struck.size:
+            np.subtract.at(flat_bricks, cells, 1)
+            np.maximum(flat_bricks, 0, out=flat_bricks)
+            hits[struck] += 1
+            x0[struck], y0[struck], dx[struck], dy[struck] = bounce(
+                cells, x0[struck], y0[struck], dx[struck], dy[struck], size)
+            touched = touching(x0[struck][grid], y0[struck][grid],
+                               dx[struck][grid], dy[struck][grid], bricks,
+                               size).reshape(struck.size, -1)
+            more = touched.any(axis=1)
+            struck = struck[more]
+            cells = np.argmax(touched[more], axis=1)
+
+        landed = floor_next[balls]
+        floor_x[balls[landed]] = x0[balls[landed]]
+        flying[balls[landed]] = False
+        bounced = balls[~landed]
+
+        # balls flying towards a brick that was just destroyed go further
+        destroyed = alive & (flat_bricks == 0)
+        if destroyed.any():
+            affected = flying & hit_next[:, destroyed].any(axis=1)
+            affected[balls] = False
+            affected = np.flatnonzero(affected)
+            if affected.size:
+                # balls not launched yet stay where they are
+                elapsed = np.maximum(t - t0[affected], 0)
+                x0[affected] += dx[affected] * elapsed
+                y0[affected] += dy[affected] * elapsed
+                t0[affected] = np.maximum(t0[affected], t)
+                bounced = np.concatenate([bounced, affected])
+
+        if bounced.size:
+            schedule(bounced)
+
+    raise RuntimeError('balls did not reach the floor after %d events'
+                       % (max_events * num_balls))
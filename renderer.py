@@ -0,0 +1,177 @@
+'''
+Copyright 2017 Marianne Linhares Monteiro, @mari-linhares at github.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import math
+import multiprocessing
+import signal
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# for vectors manipulation
+import numpy as np
+import pygame
+
+from game import BLACK, WHITE, SpriteCache
+from physics import (BALL_SIZE, BALL_START, BLOCK_SIZE, FLOOR_LIMIT,
+                     LINE_HEIGHT, SCREEN_SIZE)
+
+# snapshots waiting to be drawn, newer ones are dropped when it is full
+QUEUE_SIZE = 4
+
+
+def interpolate(path, step):
+    '''Positions every step pixels along the segments of path.'''
+    for (x0, y0), (x1, y1) in zip(path[:-1], path[1:]):
+        length = math.hypot(x1 - x0, y1 - y0)
+        for i in range(int(length // step)):
+            t = i * step / length
+            yield x0 + (x1 - x0) * t, y0 + (y1 - y0) * t
+    if path:
+        yield path[-1]
+
+
+def draw_snapshot(screen, sprites, bricks_matrix, ball, phase, max_phase):
+    '''Same picture as Environment.draw, from a snapshot.'''
+    screen.fill(BLACK)
+    for r, c in zip(*np.nonzero(bricks_matrix)):
+        screen.blit(sprites.brick(int(bricks_matrix[r, c])),
+                    (c * BLOCK_SIZE, r * BLOCK_SIZE + BLOCK_SIZE))
+
+    pygame.draw.circle(screen, WHITE, (int(ball[0]), int(ball[1])), BALL_SIZE)
+
+    stats = sprites.text('LEVEL: %d BEST : %d' % (phase, max_phase))
+    screen.blit(stats, ((SCREEN_SIZE[0] - stats.get_width()) / 2, 10))
+
+    pygame.draw.rect(screen, WHITE, (0, BLOCK_SIZE - LINE_HEIGHT,
+                                     SCREEN_SIZE[0], LINE_HEIGHT))
+    pygame.draw.rect(screen, WHITE, (0, FLOOR_LIMIT,
+                                     SCREEN_SIZE[0], LINE_HEIGHT))
+    pygame.display.flip()
+
+
+def render_loop(snapshots, fps, ball_speed):
+    '''Main loop of the renderer process, ends with a None snapshot or when
+       the window is closed.
+    '''
+    pygame.init()
+    screen = pygame.display.set_mode(SCREEN_SIZE)
+    pygame.display.set_caption('brick blast ball (live)')
+    clock = pygame.time.Clock()
+    sprites = SpriteCache(pygame.font.Font(None, 30))
+
+    def closed():
+        return any(e.type == pygame.QUIT for e in pygame.event.get())
+
+    while not closed():
+        try:
+            snapshot = snapshots.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if snapshot is None:
+            break
+
+        board, path, after_shot, phase, max_phase = snapshot
+        # the shot is only animated if no newer snapshot is waiting
+        for ball in interpolate(path or [], ball_speed):
+            if not snapshots.empty() or closed():
+                break
+            draw_snapshot(screen, sprites, board, ball, phase, max_phase)
+            clock.tick(fps)
+        draw_snapshot(screen, sprites, after_shot, BALL_START, phase,
+                      max_phase)
+    pygame.quit()
+
+
+class Renderer():
+    '''Draws the shots of an Environment in a separate process.
+
+       The environment only puts snapshots (boards before and after the shot
+       and the path of the ball) in a bounded queue without waiting, a
+       snapshot that does not fit is dropped. So drawing never slows down the
+       simulation, see Environment.attach_renderer.
+    '''
+    def __init__(self, queue_size=QUEUE_SIZE, fps=50, ball_speed=15):
+        self.snapshots = multiprocessing.Queue(queue_size)
+        self.process = multiprocessing.Process(
+            target=render_loop, args=(self.snapshots, fps, ball_speed))
+        self.process.daemon = True
+        self.dropped = 0
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start(self):
+        self.process.start()
+        return self
+
+    def submit(self, board, path, after_shot, phase, max_phase):
+        try:
+            self.snapshots.put_nowait((board, path, after_shot, phase,
+                                       max_phase))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=1.0):
+        try:
+            self.snapshots.put_nowait(None)
+        except queue.Full:
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class RendererToggle():
+    '''Attaches a live view to env when the process receives signum, and
+       detaches it on the next one (kill -USR1 <pid> on a training process).
+
+       The signal handler only records the request, apply() (called by the
+       training loop between episodes) attaches or closes the renderer, so
+       the environment never changes in the middle of a shot and the handler
+       never waits for the renderer process.
+    '''
+    def __init__(self, env, signum=signal.SIGUSR1, **renderer_kwargs):
+        self.env = env
+        self.renderer_kwargs = renderer_kwargs
+        self.requested = False
+        signal.signal(signum, self.request)
+
+    def request(self, *_):
+        # two signals before apply cancel each other
+        self.requested = not self.requested
+
+    def apply(self):
+        if not self.requested:
+            return
+        self.requested = False
+        renderer = self.env.detach_renderer()
+        if renderer is not None:
+            renderer.close()
+        else:
+            self.env.attach_renderer(Renderer(**self.renderer_kwargs).start())
+
+
+def toggle_on_signal(env, signum=signal.SIGUSR1, **renderer_kwargs):
+    '''Returns a RendererToggle for env, its apply() must be called between
+       episodes.
+    '''
+    return RendererToggle(env, signum, **renderer_kwargs)
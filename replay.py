@@ -0,0 +1,175 @@
+'''
+Copyright 2017 Marianne Linhares Monteiro, @mari-linhares at github.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# for vectors manipulation
+import numpy as np
+
+from board import BIT_VALUES, NUM_CELLS, BitBoard, pack
+from seeding import make_rng
+
+
+def state_values(s):
+    '''Values of the cells of a bricks_matrix or a compact board (see
+       board.py) as a flat tensor.
+    '''
+    if hasattr(s, 'to_array'):
+        s = s.to_array()
+    return np.ravel(s)
+
+
+def pack_state(s):
+    '''Packs a bricks_matrix or a compact board with 0/1 bricks.'''
+    if isinstance(s, BitBoard):
+        return s.bits
+    values = state_values(s)
+    if np.any(values > 1):
+        raise ValueError('bricks with values above 1 can not be packed, '
+                         'use ReplayBuffer(values=True)')
+    return pack(values)
+
+
+def unpack_states(packed):
+    '''(n,) packed boards to a (n, cells) float tensor.'''
+    packed = np.asarray(packed, dtype=np.uint64)
+    return ((packed[:, np.newaxis] & BIT_VALUES) != 0).astype(float)
+
+
+class ReplayBuffer():
+    '''Fixed capacity buffer of (s, a, r, s', a') transitions.
+
+       Everything is stored in preallocated arrays and the oldest
+       transitions are overwritten when the buffer is full. States are
+       0/1 boards packed in a uint64 each (see board.pack), or with values
+       (for bricks with values above 1) one uint8 per cell.
+
+       With prioritized, transitions are sampled with probability
+       proportional to (|delta| + epsilon) ^ alpha, new transitions get the
+       highest priority seen so far.
+    '''
+    def __init__(self, capacity=100000, prioritized=False, alpha=0.6,
+                 beta=0.4, epsilon=1e-3, rng=None, values=False):
+        self.capacity = capacity
+        self.prioritized = prioritized
+        self.alpha = alpha
+        self.beta = beta
+        self.epsilon = epsilon
+        self.rng = rng if rng is not None else make_rng(None)
+
+        self.values = values
+        state_shape = (capacity, NUM_CELLS) if values else capacity
+        state_dtype = np.uint8 if values else np.uint64
+        self.states = np.zeros(state_shape, dtype=state_dtype)
+        self.actions = np.zeros(capacity, dtype=np.int16)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros(state_shape, dtype=state_dtype)
+        self.next_actions = np.zeros(capacity, dtype=np.int16)
+        self.terminals = np.zeros(capacity, dtype=bool)
+        self.priorities = np.zeros(capacity, dtype=np.float32)
+
+        self.size = 0
+        self.next_index = 0
+        self.max_priority = 1.0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, s, a, r, next_s, next_a, terminal):
+        '''Stores a transition, s and next_s are bricks_matrix or BitBoard.'''
+        i = self.next_index
+        self.states[i] = self.encode(s)
+        self.actions[i] = a
+        self.rewards[i] = r
+        self.next_states[i] = self.encode(next_s)
+        self.next_actions[i] = next_a
+        self.terminals[i] = terminal
+        self.priorities[i] = self.max_priority
+
+        self.next_index = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def encode(self, s):
+        return state_values(s) if self.values else pack_state(s)
+
+    def decode(self, states):
+        '''Stored states to a (n, cells) float tensor.'''
+        return states.astype(float) if self.values else unpack_states(states)
+
+    def sample(self, batch_size):
+        '''Samples a minibatch.
+
+            Returns:
+                indexes (tensor): positions of the transitions, used by
+                    update_priorities.
+                batch (tuple): states (batch, cells), actions, rewards,
+                    next_states (batch, cells), next_actions, terminals.
+                weights (tensor): importance sampling weights (all ones
+                    when the buffer is not prioritized).
+        '''
+        if self.prioritized:
+            p = self.priorities[:self.size].astype(float) ** self.alpha
+            p /= p.sum()
+            indexes = self.rng.choice(self.size, batch_size, p=p)
+            weights = (self.size * p[indexes]) ** -self.beta
+            weights /= weights.max()
+        else:
+            indexes = self.rng.randint(self.size, size=batch_size)
+            weights = np.ones(batch_size)
+
+        batch = (self.decode(self.states[indexes]),
+                 self.actions[indexes].astype(int),
+                 self.rewards[indexes].astype(float),
+                 self.decode(self.next_states[indexes]),
+                 self.next_actions[indexes].astype(int),
+                 self.terminals[indexes])
+        return indexes, batch, weights
+
+    def get_state(self):
+        '''Everything needed to continue sampling exactly (see set_state).'''
+        filled = slice(0, self.size)
+        return {'rng': self.rng.get_state(),
+                'capacity': self.capacity,
+                'states': self.states[filled].copy(),
+                'actions': self.actions[filled].copy(),
+                'rewards': self.rewards[filled].copy(),
+                'next_states': self.next_states[filled].copy(),
+                'next_actions': self.next_actions[filled].copy(),
+                'terminals': self.terminals[filled].copy(),
+                'priorities': self.priorities[filled].copy(),
+                'next_index': self.next_index,
+                'max_priority': self.max_priority}
+
+    def set_state(self, state):
+        '''Restores a state returned by get_state (same capacity and kind
+           of states).
+        '''
+        if state['capacity'] != self.capacity or \
+                state['states'].shape[1:] != self.states.shape[1:]:
+            raise ValueError('the state is for a buffer of %d transitions '
+                             'with %s states' % (state['capacity'],
+                                                 state['states'].dtype))
+        size = state['actions'].size
+        self.rng.set_state(state['rng'])
+        for name in ('states', 'actions', 'rewards', 'next_states',
+                     'next_actions', 'terminals', 'priorities'):
+            getattr(self, name)[:size] = state[name]
+        self.size = size
+        self.next_index = state['next_index']
+        self.max_priority = state['max_priority']
+
+    def update_priorities(self, indexes, deltas):
+        priorities = np.abs(deltas) + self.epsilon
+        self.priorities[indexes] = priorities
+        self.max_priority = max(self.max_priority, priorities.max())
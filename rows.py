@@ -0,0 +1,129 @@
+'''
+Copyright 2017 Marianne Linhares Monteiro, @mari-linhares at github.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# for vectors manipulation
+import numpy as np
+
+from physics import NUM_ROWS, NUM_COLS
+from seeding import make_rng
+
+
+class RowGenerator():
+    '''Generates random rows of bricks without rejection sampling.
+
+       A row can not be empty nor full, so instead of sampling cells and
+       trying again the row is sampled directly among the 2^cols - 2 valid
+       patterns, each one with the probability it would have after the
+       rejection. Rows are generated batch_size at a time with a single
+       call to the random generator.
+
+       Args:
+           brick_probability (float): chance of having a brick in a cell.
+           values (dict): value -> probability of a brick having that
+               value, for example {1: 0.625, 2: 0.25, 4: 0.125}. By default
+               every brick has value 1.
+           rng: np.random.RandomState, a new one seeded from the OS by
+               default.
+    '''
+    def __init__(self, num_cols=NUM_COLS, brick_probability=0.5, values=None,
+                 batch_size=1024, rng=None):
+        self.num_cols = num_cols
+        self.batch_size = batch_size
+        self.rng = rng if rng is not None else make_rng(None)
+
+        # every valid pattern as a (patterns, cols) 0/1 tensor
+        codes = np.arange(1, 2 ** num_cols - 1)
+        self.patterns = (codes[:, np.newaxis] >> np.arange(num_cols)) & 1
+        bricks = self.patterns.sum(axis=1)
+        p = (brick_probability ** bricks *
+             (1 - brick_probability) ** (num_cols - bricks))
+        self.pattern_probabilities = p / p.sum()
+
+        values = values or {1: 1.0}
+        self.values = np.array(sorted(values), dtype=float)
+        p = np.array([values[v] for v in sorted(values)], dtype=float)
+        self.value_probabilities = p / p.sum()
+
+        self.batch = np.zeros((0, num_cols))
+        self.next_index = 0
+
+    def sample(self, n):
+        '''n random rows as a (n, cols) tensor.'''
+        choice = self.rng.choice(self.patterns.shape[0], n,
+                                 p=self.pattern_probabilities)
+        rows = self.patterns[choice].astype(float)
+        if self.values.size > 1:
+            rows *= self.rng.choice(self.values, (n, self.num_cols),
+                                    p=self.value_probabilities)
+        else:
+            rows *= self.values[0]
+        return rows
+
+    def get_state(self):
+        '''Pre-generated rows not used yet (the rng state is not included).'''
+        return self.batch[self.next_index:].copy()
+
+    def set_state(self, batch):
+        self.batch = batch
+        self.next_index = 0
+
+    def next_row(self):
+        '''One random row, taken from the pre-generated batch.'''
+        if self.next_index == self.batch.shape[0]:
+            self.batch = self.sample(self.batch_size)
+            self.next_index = 0
+        row = self.batch[self.next_index]
+        self.next_index += 1
+        return row
+
+
+class RingBoard():
+    '''bricks_matrix that inserts a row without moving the other rows.
+
+       Rows are stored in a buffer with capacity rows and the board is the
+       view buffer[head:head + rows]. Inserting a row only moves head one
+       row up, the board is copied back to the end of the buffer when head
+       reaches the beginning, once every capacity - rows insertions.
+    '''
+    def __init__(self, rows=NUM_ROWS, cols=NUM_COLS, capacity=64 * NUM_ROWS,
+                 dtype=float):
+        self.rows = rows
+        self.buffer = np.zeros((capacity, cols), dtype=dtype)
+        self.move_head(capacity - rows)
+
+    def move_head(self, head):
+        self.head = head
+        # the board (a view on the buffer, changes to it are kept)
+        self.view = self.buffer[head:head + self.rows]
+
+    def reset(self):
+        self.view[:] = 0
+
+    def load(self, matrix):
+        self.view[:] = matrix
+
+    def insert_row(self, row):
+        '''Same as np.roll(board, cols) (the last row becomes the first one)
+           followed by board[1] = row, as in Environment.create_next_row.
+        '''
+        if self.head == 0:
+            self.buffer[-self.rows:] = self.buffer[:self.rows]
+            self.move_head(self.buffer.shape[0] - self.rows)
+
+        last_row = self.buffer[self.head + self.rows - 1]
+        self.move_head(self.head - 1)
+        self.buffer[self.head] = last_row
+        self.buffer[self.head + 1] = row
@@ -0,0 +1,45 @@
+'''
+Copyright 2017 Marianne Linhares Monteiro, @mari-linhares at github.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import hashlib
+
+# for vectors manipulation
+import numpy as np
+
+
+def spawn_seeds(seed, n, start=0):
+    '''Seeds of the independent streams start, ..., start + n - 1 of seed.
+
+       Each seed is a hash of (seed, stream), so streams do not overlap
+       like seed + i would (stream 1 of seed 0 is not stream 0 of seed 1)
+       and stream i is the same however many streams are spawned.
+    '''
+    seeds = []
+    for stream in range(start, start + n):
+        digest = hashlib.sha256('%d/%d' % (seed, stream)).hexdigest()
+        # 8 hexadecimal digits are 32 bits
+        seeds.append(int(digest[:8], 16))
+    return seeds
+
+
+def make_rng(seed=None):
+    '''np.random.RandomState seeded with seed (from the OS if it is None).'''
+    return np.random.RandomState(seed)
+
+
+def spawn_rngs(seed, n):
+    '''n independent generators derived from seed.'''
+    return [make_rng(s) for s in spawn_seeds(seed, n)]
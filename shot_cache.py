@@ -0,0 +1,76 @@
+'''
+Copyright 2017 Marianne Linhares Monteiro, @mari-linhares at github.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+from collections import OrderedDict
+
+from board import make_board
+import physics
+
+
+class ShotCache():
+    '''Size bounded LRU cache of shot outcomes.
+
+       A shot always starts from physics.BALL_START, so its outcome only
+       depends on the board and on the action: the cache maps
+       (board, action) to the board after the shot and the floor position.
+       Boards are stored as compact boards (see board.py).
+    '''
+    def __init__(self, max_size=100000, actions=physics.ACTIONS):
+        self.max_size = max_size
+        self.actions = actions
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def key(self, bricks_matrix, action):
+        return make_board(bricks_matrix), action
+
+    def resolve(self, bricks_matrix, action):
+        '''Same as physics.solve_shot from the start position with angle
+           self.actions[action], returns (floor_x, bricks_matrix, hits).
+        '''
+        key = self.key(bricks_matrix, action)
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            x, y = physics.BALL_START
+            floor_x, bricks, hits = physics.solve_shot(bricks_matrix, x, y,
+                                                       self.actions[action])
+            entry = floor_x, make_board(bricks), hits
+            if len(self.entries) >= self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+        # most recently used entries are at the end
+        self.entries[key] = entry
+        floor_x, bricks, hits = entry
+        return floor_x, bricks.to_array(), hits
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / float(total) if total else 0.0
+
+    def stats(self):
+        return {'size': len(self.entries), 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': self.hit_rate()}
@@ -0,0 +1,124 @@
+'''
+Copyright 2017 Marianne Linhares Monteiro, @mari-linhares at github.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# for vectors manipulation
+import numpy as np
+
+# below this the stored values are rescaled to avoid underflow
+MIN_SCALE = 1e-100
+
+
+class DenseEligibilityTrace():
+    '''Accumulating eligibility trace stored as a dense vector.
+
+       Default of LinearFunctionSarsaAgent: with its 63 x 31 parameters a
+       whole vector operation is cheaper than any bookkeeping of the active
+       entries. Same interface as EligibilityTrace.
+    '''
+    def __init__(self, size):
+        self.values = np.zeros(size)
+
+    def __len__(self):
+        return np.count_nonzero(self.values)
+
+    def clear(self):
+        self.values[:] = 0
+
+    def add(self, indexes, values):
+        '''trace[indexes] += values (indexes are not repeated, as the
+           ones of LinearFunctionSarsaAgent.active_features).
+        '''
+        self.values[indexes] += values
+
+    def decay(self, factor):
+        '''trace *= factor'''
+        self.values *= factor
+
+    def items(self):
+        '''Indexes and values of the non zero entries.'''
+        indexes = np.flatnonzero(self.values)
+        return indexes, self.values[indexes]
+
+    def apply(self, target, step):
+        '''target += step * trace'''
+        target += step * self.values
+
+    def to_dense(self, size):
+        return self.values.copy()
+
+
+class EligibilityTrace():
+    '''Sparse accumulating eligibility trace, for feature layouts much
+       larger than the number of features active in an episode.
+
+       Only entries with absolute value >= cutoff are kept, as sorted
+       indexes and their values in two arrays. Values are stored divided by
+       a global scale, so decaying the whole trace only multiplies the scale
+       and every operation costs O(len(trace)) instead of O(number of
+       parameters).
+    '''
+    def __init__(self, cutoff=1e-4):
+        self.cutoff = cutoff
+        self.clear()
+
+    def __len__(self):
+        return self.indexes.size
+
+    def clear(self):
+        self.indexes = np.zeros(0, dtype=int)
+        self.values = np.zeros(0)
+        self.scale = 1.0
+
+    def add(self, indexes, values):
+        '''trace[indexes] += values'''
+        indexes = np.ravel(indexes)
+        values = np.ravel(values) / self.scale
+        if self.indexes.size:
+            indexes = np.concatenate((self.indexes, indexes))
+            values = np.concatenate((self.values, values))
+        # repeated indexes are summed
+        self.indexes, position = np.unique(indexes, return_inverse=True)
+        self.values = np.bincount(position, weights=values)
+
+    def decay(self, factor):
+        '''trace *= factor, dropping entries that fall below the cutoff.'''
+        if factor == 0:
+            self.clear()
+            return
+
+        self.scale *= factor
+        keep = np.abs(self.values) >= self.cutoff / self.scale
+        if not keep.all():
+            self.indexes = self.indexes[keep]
+            self.values = self.values[keep]
+
+        if self.scale < MIN_SCALE:
+            self.values *= self.scale
+            self.scale = 1.0
+
+    def items(self):
+        '''Indexes and current values of the stored entries.'''
+        return self.indexes, self.values * self.scale
+
+    def apply(self, target, step):
+        '''target += step * trace, only touching the stored entries.'''
+        if self.indexes.size:
+            target[self.indexes] += (step * self.scale) * self.values
+
+    def to_dense(self, size):
+        dense = np.zeros(size)
+        self.apply(dense, 1.0)
+        return dense
@@ -0,0 +1,111 @@
+'''
+Copyright 2017 Marianne Linhares Monteiro, @mari-linhares at github.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import atexit
+import logging
+import os
+import weakref
+
+COLUMNS = ['episode', 'length', 'reward', 'epsilon', 'wall_time']
+HEADER = ', '.join(COLUMNS)
+
+logger = logging.getLogger(__name__)
+
+# logs that are still open, closed at exit (weak references, so a log that
+# is not used anymore can still be collected)
+_open_logs = weakref.WeakSet()
+
+
+@atexit.register
+def _close_open_logs():
+    for training_log in list(_open_logs):
+        training_log.close()
+
+# -v shows training progress, -vv every step the agent takes
+VERBOSITY = {0: logging.WARNING, 1: logging.INFO, 2: logging.DEBUG}
+
+
+def configure_logging(verbosity=0):
+    '''Configures the console output, silent by default.'''
+    level = VERBOSITY.get(verbosity, logging.DEBUG)
+    logging.basicConfig(level=level, format='%(message)s')
+
+
+def rotate(path):
+    '''Renames path to the first free name.1.ext, name.2.ext... and returns
+       the new name.
+    '''
+    name, ext = os.path.splitext(path)
+    n = 1
+    while os.path.exists('%s.%d%s' % (name, n, ext)):
+        n += 1
+    rotated = '%s.%d%s' % (name, n, ext)
+    os.rename(path, rotated)
+    return rotated
+
+
+class TrainingLog():
+    '''Buffered CSV log with one row per training episode.
+
+       Rows are kept in memory and written flush_every rows at a time, the
+       remaining rows are written by close(), which also runs at exit.
+
+       An existing file with other columns (for example written by an older
+       version) is rotated (see rotate) instead of appended to.
+    '''
+    def __init__(self, path, flush_every=100):
+        self.path = path
+        self.flush_every = flush_every
+        self.rows = []
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path) as f:
+                header = f.readline().strip()
+            if header != HEADER:
+                logger.warning('%s has other columns, moved to %s', path,
+                               rotate(path))
+
+        self.f = open(path, 'a')
+        if os.path.getsize(path) == 0:
+            self.rows.append(HEADER)
+        _open_logs.add(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def log(self, episode, length, reward, epsilon, wall_time):
+        self.rows.append('%d, %d, %g, %g, %.3f' % (episode, length, reward,
+                                                   epsilon, wall_time))
+        if len(self.rows) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self.f is None:
+            return
+        if self.rows:
+            self.f.write('\n'.join(self.rows) + '\n')
+            self.rows = []
+        self.f.flush()
+
+    def close(self):
+        if self.f is not None:
+            self.flush()
+            self.f.close()
+            self.f = None
+        _open_logs.discard(self)
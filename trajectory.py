@@ -0,0 +1,256 @@
+'''
+Copyright 2017 Marianne Linhares Monteiro, @mari-linhares at github.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import argparse
+import atexit
+import os
+import struct
+import weakref
+
+# for vectors manipulation
+import numpy as np
+
+# game is imported by main, only when the episodes are replayed
+from board import NUM_CELLS, pack, unpack
+from physics import NUM_ROWS, NUM_COLS
+
+# file header: magic, version, record size, seed of the environment, how
+# its shots were simulated (event driven or frame by frame, the ball speed
+# of the frames and the balls per shot, a replay must simulate them the
+# same way) and whether the boards keep the values of the bricks
+MAGIC = 'BBTRAJ'
+VERSION = 2
+HEADER = struct.Struct('<6sHIqBHHB')
+HEADER_SIZE = 32
+
+
+def record_dtype(values=False):
+    '''One record per shot: the state before it, the values of its newest
+       row (row 1, the only one that is not a consequence of the previous
+       shots), the action and the reward.
+
+       The state is packed in 8 bytes (see board.pack) if every brick has
+       value 1, with values it takes one uint8 per cell.
+    '''
+    board = ('board', 'u1', (NUM_CELLS,)) if values else ('board', '<u8')
+    return np.dtype([('episode', '<u4'), ('step', '<u4'), board,
+                     ('row', 'u1', (NUM_COLS,)), ('reward', 'i1'),
+                     ('action', '<i2')])
+
+RECORD = record_dtype()
+
+# writers that are still open, closed at exit (weak references, so a writer
+# that is not used anymore can still be collected)
+_open_writers = weakref.WeakSet()
+
+
+@atexit.register
+def _close_open_writers():
+    for writer in list(_open_writers):
+        writer.close()
+
+
+class TrajectoryWriter():
+    '''Append-only binary log of the shots of an Environment.
+
+       Records are kept in a preallocated chunk and appended chunk_size at
+       a time, the rest is written by close(), which also runs at exit.
+       Records are never rewritten, so the file can be read (see
+       load_records) while it is still being written.
+    '''
+    def __init__(self, path, chunk_size=4096, seed=None, event_driven=False,
+                 ball_speed=15, num_balls=1, values=False):
+        self.path = path
+        self.values = values
+        self.chunk = np.zeros(chunk_size, dtype=record_dtype(values))
+        self.size = 0
+
+        header = {'seed': seed, 'event_driven': bool(event_driven),
+                  'ball_speed': ball_speed, 'num_balls': num_balls,
+                  'values': bool(values)}
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            old_header = read_header(path)
+            old_header['seed'] = seed
+            if old_header != header:
+                raise ValueError('%s was recorded with other physics'
+                                 % path)
+
+        self.f = open(path, 'ab')
+        if os.path.getsize(path) == 0:
+            packed = HEADER.pack(MAGIC, VERSION, self.chunk.itemsize,
+                                 -1 if seed is None else seed,
+                                 event_driven, ball_speed, num_balls, values)
+            self.f.write(packed.ljust(HEADER_SIZE, '\0'))
+        _open_writers.add(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(self, episode, step, bricks_matrix, action, reward):
+        record = self.chunk[self.size]
+        record['episode'] = episode
+        record['step'] = step
+        if self.values:
+            record['board'] = np.ravel(bricks_matrix)
+        elif np.any(bricks_matrix > 1):
+            raise ValueError('bricks with values above 1 need '
+                             'TrajectoryWriter(values=True)')
+        else:
+            record['board'] = pack(bricks_matrix)
+        record['row'] = bricks_matrix[1]
+        record['reward'] = reward
+        record['action'] = action
+
+        self.size += 1
+        if self.size == self.chunk.shape[0]:
+            self.flush()
+
+    def flush(self):
+        if self.f is None:
+            return
+        if self.size:
+            self.f.write(self.chunk[:self.size].tostring())
+            self.size = 0
+        self.f.flush()
+
+    def close(self):
+        if self.f is not None:
+            self.flush()
+            self.f.close()
+            self.f = None
+        _open_writers.discard(self)
+
+
+def read_header(path):
+    '''Returns the header of a trajectory file as a dict with the seed,
+       event_driven, ball_speed, num_balls and values of the recording.
+    '''
+    with open(path, 'rb') as f:
+        data = f.read(HEADER_SIZE)[:HEADER.size]
+    if len(data) != HEADER.size or not data.startswith(MAGIC):
+        raise ValueError('%s is not a trajectory file' % path)
+    (magic, version, record_size, seed, event_driven, ball_speed,
+     num_balls, values) = HEADER.unpack(data)
+    if (version != VERSION or
+            record_size != record_dtype(values).itemsize):
+        raise ValueError('%s is not a version %d trajectory file'
+                         % (path, VERSION))
+    return {'seed': None if seed == -1 else seed,
+            'event_driven': bool(event_driven), 'ball_speed': ball_speed,
+            'num_balls': num_balls, 'values': bool(values)}
+
+
+def load_records(path):
+    '''Memory maps the records of a trajectory file (read-only).
+
+       A record that was only partially written (the writer was killed) is
+       ignored.
+    '''
+    dtype = record_dtype(read_header(path)['values'])
+    count = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=HEADER_SIZE,
+                     shape=(count,))
+
+
+def record_board(record):
+    '''bricks_matrix before the shot of a record.'''
+    if record['board'].ndim:
+        # one value per cell
+        return record['board'].reshape(NUM_ROWS, NUM_COLS).astype(float)
+    board = unpack(record['board'])
+    board[1] = record['row']
+    return board
+
+
+def split_episodes(records):
+    '''Records of each episode, as a list of views on records.'''
+    starts = np.flatnonzero(np.diff(records['episode'])) + 1
+    return np.split(records, starts) if records.size else []
+
+
+def replay_episode(env, records, check=True):
+    '''Plays the shots of one recorded episode again in env.
+
+       The episode starts from the first recorded board (which is not empty
+       when the game was prefilled, see Environment.prefill) and the rows
+       come from the records instead of the random generator. env must
+       simulate the shots like the recording did (see read_header). If env
+       draws the shots (event driven shots are then simulated frame by
+       frame, which may not match the recording exactly) the board is set
+       to the recorded one before each shot. Otherwise, with check, a board
+       that does not match the recording raises ValueError.
+
+        Returns:
+            length (int): number of shots replayed.
+            reward (int): sum of the rewards.
+    '''
+    if env.phase:
+        env.init_game(env.ball_speed)
+    env.next_phase(records[0]['row'])
+    env.bricks_matrix[:] = record_board(records[0])
+    env.phase = int(records[0]['step'])
+
+    reward = 0
+    for i, record in enumerate(records):
+        if env.is_rendering():
+            env.bricks_matrix[:] = record_board(record)
+        elif check and not np.array_equal(env.bricks_matrix,
+                                          record_board(record)):
+            raise ValueError('episode %d diverged at step %d'
+                             % (record['episode'], record['step']))
+
+        row = records[i + 1]['row'] if i + 1 < len(records) else None
+        _, r = env.step(env.bricks_matrix, int(record['action']), row=row)
+        reward += r
+    return len(records), reward
+
+
+def replay(env, records, episodes=None, check=True):
+    '''Replays the recorded episodes (all of them if episodes is None).'''
+    results = []
+    for episode_records in split_episodes(records):
+        if episodes is None or episode_records[0]['episode'] in episodes:
+            results.append(replay_episode(env, episode_records, check))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded episodes.')
+    parser.add_argument('path', help='trajectory file (see agent.py --record)')
+    parser.add_argument('--episode', type=int, action='append', default=None,
+                        help='only replay this episode (can be repeated)')
+    parser.add_argument('--render', action='store_true',
+                        help='draw the episodes instead of replaying them '
+                             'at full speed')
+    args = parser.parse_args()
+
+    from game import Environment, GameState
+    header = read_header(args.path)
+    env = Environment(ball_speed=header['ball_speed'],
+                      state=GameState.AGENT_PLAYING, headless=not args.render,
+                      event_driven=header['event_driven'],
+                      num_balls=header['num_balls'])
+    records = load_records(args.path)
+    for length, reward in replay(env, records, args.episode):
+        print 'length: %d, reward: %d' % (length, reward)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+'''
+Copyright 2017 Marianne Linhares Monteiro, @mari-linhares at github.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+# -------- Imports ------------
+import numpy as np
+
+from core import insert_rows, is_lost, rewards
+import physics
+from rows import RowGenerator
+from seeding import make_rng
+
+
+# ------- Classes ----------
+class VectorEnvironment():
+    '''N brick blast ball games simulated in lockstep with NumPy.
+
+       Follows the same rules as Environment when an agent is playing (see
+       core.py), but the boards are stored as a (N, rows, cols) tensor and
+       all shots are solved together by physics.solve_shots. It does not
+       need pygame. Bricks have the values of brick_values, see
+       RowGenerator, every brick has value 1 by default.
+    '''
+    def __init__(self, num_envs, brick_probability=0.5, seed=None,
+                 brick_values=None):
+        self.num_envs = num_envs
+        self.rng = make_rng(seed)
+        self.row_generator = RowGenerator(brick_probability=brick_probability,
+                                          values=brick_values, rng=self.rng)
+
+        # agent related attributes
+        self.actions = physics.ACTIONS
+        self.number_of_actions = self.actions.shape[0]
+
+        # stores the bricks values of every game
+        self.bricks_matrix = np.zeros((num_envs, physics.NUM_ROWS,
+                                       physics.NUM_COLS))
+        self.phase = np.zeros(num_envs, dtype=int)
+
+        # max phase the environement has ever seen
+        self.max_phase = 0
+
+    def reset(self):
+        '''Starts all games again, returns the initial states.'''
+        self.bricks_matrix[:] = 0
+        self.phase[:] = 0
+        self.next_phase()
+        return self.bricks_matrix.copy()
+
+    def step(self, actions):
+        '''Shoots one ball in every game.
+
+            Games that are lost are restarted automatically, so their next
+            state is the first state of a new game.
+
+            Args:
+                actions (tensor): (N,) indexes of actions in self.actions.
+            Returns:
+                next_states (tensor): (N, rows, cols) bricks values.
+                rewards (tensor): (N,) -1 if the game was lost, 0 otherwise.
+                dones (tensor): (N,) True if the game was lost.
+        '''
+        return self.step_angles(self.actions[np.asarray(actions)])
+
+    def step_angles(self, angles):
+        '''Same as step, with any angle in (-pi/2, pi/2) instead of the
+           index of an action.
+        '''
+        x, y = physics.BALL_START
+        _, self.bricks_matrix, _ = physics.solve_shots(self.bricks_matrix,
+                                                       x, y, angles)
+
+        dones = is_lost(self.bricks_matrix)
+
+        if np.any(dones):
+            self.max_phase = max(self.max_phase, self.phase[dones].max())
+            self.bricks_matrix[dones] = 0
+            self.phase[dones] = 0
+        self.next_phase()
+
+        return self.bricks_matrix.copy(), rewards(dones), dones
+
+    def restart(self, games):
+        '''Starts the games selected by the (N,) mask games again (used to
+           stop games that are too long), returns all the states.
+        '''
+        self.bricks_matrix[games] = 0
+        self.bricks_matrix[games, 1] = self.row_generator.sample(
+            int(np.count_nonzero(games)))
+        self.phase[games] = 1
+        return self.bricks_matrix.copy()
+
+    def get_state(self):
+        '''Everything needed to continue the games exactly (see set_state).'''
+        return {'rng': self.rng.get_state(),
+                'rows': self.row_generator.get_state(),
+                'bricks_matrix': self.bricks_matrix.copy(),
+                'phase': self.phase.copy(),
+                'max_phase': self.max_phase}
+
+    def set_state(self, state):
+        '''Restores a state returned by get_state (same num_envs).'''
+        if state['bricks_matrix'].shape != self.bricks_matrix.shape:
+            raise ValueError('the state has %d games, not %d'
+                             % (state['bricks_matrix'].shape[0],
+                                self.num_envs))
+        self.rng.set_state(state['rng'])
+        self.row_generator.set_state(state['rows'])
+        self.bricks_matrix = state['bricks_matrix'].copy()
+        self.phase = state['phase'].copy()
+        self.max_phase = state['max_phase']
+        return self.bricks_matrix.copy()
+
+    # ------------------ Create rows ------------------------
+    def next_phase(self):
+        '''Moves all bricks one row below and creates a new row.'''
+        self.bricks_matrix = insert_rows(self.bricks_matrix,
+                                         self.row_generator.sample(
+                                             self.num_envs))
+        self.phase += 1